@@ -0,0 +1,21 @@
+from bson import ObjectId
+from bson.errors import InvalidId
+from fastapi import HTTPException
+
+
+def _object_id(value: str, label: str) -> ObjectId:
+    """Parse a path id into an ObjectId, rejecting malformed ids with a 400"""
+    try:
+        return ObjectId(value)
+    except (InvalidId, TypeError):
+        raise HTTPException(status_code=400, detail=f"Invalid {label} id")
+
+
+def quiz_object_id(quiz_id: str) -> ObjectId:
+    """Path dependency for routes keyed by {quiz_id}"""
+    return _object_id(quiz_id, "quiz")
+
+
+def study_set_object_id(study_set_id: str) -> ObjectId:
+    """Path dependency for routes keyed by {study_set_id}"""
+    return _object_id(study_set_id, "study set")
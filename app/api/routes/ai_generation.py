@@ -6,8 +6,10 @@ import secrets
 import os
 import logging
 
+from app.core.config import LOG_LEVEL
+
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=LOG_LEVEL)
 logger = logging.getLogger(__name__)
 
 router = APIRouter(
@@ -3,6 +3,7 @@ from datetime import datetime
 from bson import ObjectId
 
 from app.core.database import collection, attempts_collection, reviews_collection, results_collection
+from app.utils.helpers import format_created_at
 
 router = APIRouter(tags=["analytics"])
 
@@ -48,7 +49,7 @@ async def get_quiz_stats(quiz_id: str):
                 "average_score": round(avg_score, 2),
                 "question_count": len(quiz.get("questions", [])),
                 "views": quiz.get("views", 0),
-                "created_at": quiz.get("createdAt", "")
+                "created_at": format_created_at(quiz.get("createdAt"))
             }
         }
     except Exception as e:
@@ -160,7 +161,7 @@ async def get_dashboard_stats():
                 "id": str(quiz["_id"]),
                 "title": quiz.get("title", ""),
                 "category": quiz.get("category", ""),
-                "createdAt": quiz.get("createdAt", "")
+                "createdAt": format_created_at(quiz.get("createdAt"))
             }
             for quiz in recent_quizzes
         ]
@@ -1,10 +1,16 @@
 from fastapi import APIRouter, HTTPException, Query
-from typing import List
+from typing import List, Optional
 from datetime import datetime
 from bson import ObjectId
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
 
-from app.models.flashcard import FlashcardSet, FlashcardSetResponse, FlashcardLibraryItem, FlashcardLibraryResponse
+from app.models.flashcard import FlashcardSet, FlashcardSetResponse, FlashcardLibraryResponse
+from app.core.config import COVER_IMAGES, DEFAULT_COVER
 from app.core.database import db
+from app.core.responses import ORJSONResponse
+from app.services.library_cache import library_cache
+from app.utils.helpers import format_created_at
 
 router = APIRouter(prefix="/flashcards", tags=["flashcards"])
 
@@ -33,9 +39,9 @@ async def create_flashcard_set(flashcard_set: FlashcardSet):
         flashcard_dict = flashcard_set.dict()
         flashcard_dict.pop("id", None)
 
-        # Format createdAt as "Month, Year"
-        now = datetime.utcnow()
-        flashcard_dict["createdAt"] = now.strftime("%B, %Y")
+        # Store createdAt as a BSON Date so it sorts chronologically;
+        # it is formatted as "Month, Year" when returned
+        flashcard_dict["createdAt"] = datetime.utcnow()
 
         # Set originalOwner to creatorId if not provided
         if not flashcard_dict.get("originalOwner"):
@@ -44,85 +50,117 @@ async def create_flashcard_set(flashcard_set: FlashcardSet):
         # Set default cover image based on category if not provided
         if not flashcard_dict.get("coverImagePath"):
             category = flashcard_dict.get("category", "others").lower()
-            if category == "language learning":
-                flashcard_dict["coverImagePath"] = "https://img.freepik.com/free-vector/notes-concept-illustration_114360-839.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            elif category == "science and technology":
-                flashcard_dict["coverImagePath"] = "https://img.freepik.com/free-vector/coding-concept-illustration_114360-1155.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            elif category == "law":
-                flashcard_dict["coverImagePath"] = "http://img.freepik.com/free-vector/law-firm-concept-illustration_114360-8626.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            else:
-                flashcard_dict["coverImagePath"] = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
+            flashcard_dict["coverImagePath"] = COVER_IMAGES.get(category, DEFAULT_COVER)
 
         result = await flashcard_collection.insert_one(flashcard_dict)
+        await library_cache.invalidate(flashcard_dict["creatorId"])
         return FlashcardSetResponse(
             id=str(result.inserted_id),
             message="Flashcard set created successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/library/{user_id}", response_model=FlashcardLibraryResponse, summary="Get all flashcard sets created by a user")
-async def get_flashcard_library_by_user(user_id: str):
+async def get_flashcard_library_by_user(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     try:
-        cursor = flashcard_collection.find(
-            {"creatorId": user_id},
-            {
+        if cursor is not None and not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
+
+        # Keyset pagination on _id (newest first) backed by the (creatorId, _id) index
+        match = {"creatorId": user_id}
+        if cursor:
+            match["_id"] = {"$lt": ObjectId(cursor)}
+
+        results = flashcard_collection.aggregate([
+            {"$match": match},
+            {"$sort": {"_id": -1}},
+            {"$limit": limit},
+            {"$project": {
                 "title": 1,
                 "description": 1,
                 "coverImagePath": 1,
                 "createdAt": 1,
-                "cards": 1,
                 "category": 1,
-                "_id": 1,
-                "creatorId": 1,
-                "originalOwner": 1
-            }
-        ).sort("createdAt", -1)
-
-        flashcard_sets = await cursor.to_list(length=None)
+                "originalOwner": 1,
+                "cardCount": {"$size": {"$ifNull": ["$cards", []]}}
+            }}
+        ])
 
-        fallback_image = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
+        flashcard_sets = await results.to_list(length=limit)
 
         flashcard_items = [
-            FlashcardLibraryItem(
-                id=str(fs["_id"]),
-                title=fs.get("title", "Untitled Flashcard Set"),
-                description=fs.get("description", ""),
-                coverImagePath=fs.get("coverImagePath") or fallback_image,
-                createdAt=fs.get("createdAt", ""),
-                cardCount=len(fs.get("cards", [])),
-                category=fs.get("category", ""),
-                originalOwner=fs.get("originalOwner"),
-                originalOwnerUsername=None
-            )
+            {
+                "id": str(fs["_id"]),
+                "title": fs.get("title", "Untitled Flashcard Set"),
+                "description": fs.get("description", ""),
+                "coverImagePath": fs.get("coverImagePath") or DEFAULT_COVER,
+                "createdAt": format_created_at(fs.get("createdAt")),
+                "cardCount": fs["cardCount"],
+                "category": fs.get("category", ""),
+                "originalOwner": fs.get("originalOwner"),
+                "originalOwnerUsername": None
+            }
             for fs in flashcard_sets
         ]
 
-        return FlashcardLibraryResponse(
-            success=True,
-            data=flashcard_items,
-            count=len(flashcard_items)
-        )
+        # Returning a response directly skips FastAPI's response_model re-validation;
+        # the model is kept on the route for the OpenAPI schema
+        return ORJSONResponse({
+            "success": True,
+            "data": flashcard_items,
+            "count": len(flashcard_items),
+            "next_cursor": flashcard_items[-1]["id"] if len(flashcard_items) == limit else None
+        })
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/{flashcard_set_id}", response_model=FlashcardSet, summary="Get a specific flashcard set with all cards")
-async def get_flashcard_set(flashcard_set_id: str, user_id: str = Query(...)):
+async def get_flashcard_set(
+    flashcard_set_id: str,
+    user_id: str = Query(...),
+    fields: Optional[str] = Query(None, description="Comma-separated fields to return, e.g. title,description (all fields if omitted)")
+):
     try:
         if not ObjectId.is_valid(flashcard_set_id):
             raise HTTPException(status_code=400, detail="Invalid flashcard set ID")
 
+        # Only fetch the requested fields (e.g. skip the cards array for previews)
+        projection = None
+        if fields:
+            requested = [f.strip() for f in fields.split(",")]
+            projection = {f: 1 for f in requested if f in FlashcardSet.model_fields and f != "id"}
+            if not projection:
+                raise HTTPException(status_code=400, detail="No valid fields requested")
+
         flashcard_set = await flashcard_collection.find_one(
-            {"_id": ObjectId(flashcard_set_id), "creatorId": user_id}
+            {"_id": ObjectId(flashcard_set_id), "creatorId": user_id},
+            projection
         )
 
         if not flashcard_set:
             raise HTTPException(status_code=404, detail="Flashcard set not found")
 
         flashcard_set["id"] = str(flashcard_set.pop("_id"))
-        return FlashcardSet(**flashcard_set)
+        if "createdAt" in flashcard_set or projection is None:
+            flashcard_set["createdAt"] = format_created_at(flashcard_set.get("createdAt"))
+
+        if projection is not None:
+            # Partial documents don't satisfy FlashcardSet, return the projected fields as-is
+            return ORJSONResponse(flashcard_set)
+
+        # Validate once here and return the response directly (no second response_model pass)
+        return ORJSONResponse(FlashcardSet(**flashcard_set).model_dump())
     except HTTPException:
         raise
     except Exception as e:
@@ -135,11 +173,16 @@ async def delete_flashcard_set(flashcard_set_id: str):
         if not ObjectId.is_valid(flashcard_set_id):
             raise HTTPException(status_code=400, detail="Invalid flashcard set ID")
 
-        result = await flashcard_collection.delete_one({"_id": ObjectId(flashcard_set_id)})
+        deleted = await flashcard_collection.find_one_and_delete(
+            {"_id": ObjectId(flashcard_set_id)},
+            projection={"creatorId": 1}
+        )
 
-        if result.deleted_count == 0:
+        if not deleted:
             raise HTTPException(status_code=404, detail="Flashcard set not found")
 
+        await library_cache.invalidate(deleted.get("creatorId"))
+
         return {"success": True, "message": "Flashcard set deleted successfully"}
     except HTTPException:
         raise
@@ -165,18 +208,32 @@ async def add_flashcard_to_library(data: dict):
         if not original_set:
             raise HTTPException(status_code=404, detail="Flashcard set not found")
 
-        # Create a copy for the new user
-        new_set = original_set.copy()
-        new_set.pop("_id")
-        new_set["creatorId"] = user_id
-        new_set["originalOwner"] = original_set.get("creatorId")
-
-        result = await flashcard_collection.insert_one(new_set)
+        # Reuse the fetched document as the new user's copy instead of cloning it
+        source_id = original_set.pop("_id")
+        original_set["originalOwner"] = original_set.get("creatorId")
+        original_set["creatorId"] = user_id
+        original_set["originalSourceId"] = source_id
+
+        # Upsert keyed on (creatorId, originalSourceId) so repeated adds (e.g. a double tap)
+        # return the existing copy instead of inserting another one
+        copy_filter = {"creatorId": user_id, "originalSourceId": source_id}
+        try:
+            added = await flashcard_collection.find_one_and_update(
+                copy_filter,
+                {"$setOnInsert": original_set},
+                upsert=True,
+                projection={"_id": 1},
+                return_document=ReturnDocument.AFTER
+            )
+        except DuplicateKeyError:
+            # A concurrent request inserted the copy first
+            added = await flashcard_collection.find_one(copy_filter, {"_id": 1})
+        await library_cache.invalidate(user_id)
 
         return {
             "success": True,
             "message": "Flashcard set added to library",
-            "id": str(result.inserted_id)
+            "id": str(added["_id"])
         }
     except HTTPException:
         raise
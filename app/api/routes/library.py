@@ -1,6 +1,12 @@
-from fastapi import APIRouter, HTTPException
-from typing import List, Union
+import orjson
+from bson import ObjectId
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional, Union
+from app.core.config import DEFAULT_COVER
 from app.core.database import db
+from app.services.library_cache import library_cache
+from app.utils.helpers import format_created_at
 from pydantic import BaseModel
 
 router = APIRouter(prefix="/library", tags=["library"])
@@ -29,146 +35,166 @@ class UnifiedLibraryResponse(BaseModel):
     success: bool
     data: List[LibraryItem]
     count: int
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page
+
+# Default titles for library items missing one, by item type
+DEFAULT_TITLES = {
+    "quiz": "Untitled Quiz",
+    "flashcard": "Untitled Flashcard Set",
+    "note": "Untitled Note",
+    "study_set": "Untitled Study Set",
+}
+
+def _page_stages(owner_field: str, user_id: str, limit: int, before: Optional[ObjectId]) -> list:
+    """Match one page of a user's documents, newest first, using the (owner, _id) index"""
+    match = {owner_field: user_id}
+    if before is not None:
+        match["_id"] = {"$lt": before}
+    return [{"$match": match}, {"$sort": {"_id": -1}}, {"$limit": limit}]
+
+def _library_pipeline(user_id: str, limit: int, before: Optional[ObjectId]) -> list:
+    """Aggregation that unions one page of a user's quizzes, flashcards, notes and
+    study sets into the LibraryItem shape, newest first"""
+    return [
+        *_page_stages("creatorId", user_id, limit, before),
+        {"$project": {
+            "type": {"$literal": "quiz"},
+            "title": 1,
+            "description": 1,
+            "coverImagePath": 1,
+            "createdAt": 1,
+            "language": 1,
+            "category": 1,
+            "originalOwner": 1,
+            "sharedMode": 1,
+            "itemCount": {"$size": {"$ifNull": ["$questions", []]}}
+        }},
+        {"$unionWith": {
+            "coll": flashcard_collection.name,
+            "pipeline": [
+                *_page_stages("creatorId", user_id, limit, before),
+                {"$project": {
+                    "type": {"$literal": "flashcard"},
+                    "title": 1,
+                    "description": 1,
+                    "coverImagePath": 1,
+                    "createdAt": 1,
+                    "category": 1,
+                    "originalOwner": 1,
+                    "itemCount": {"$size": {"$ifNull": ["$cards", []]}}
+                }}
+            ]
+        }},
+        {"$unionWith": {
+            "coll": note_collection.name,
+            "pipeline": [
+                *_page_stages("creatorId", user_id, limit, before),
+                {"$project": {
+                    "type": {"$literal": "note"},
+                    "title": 1,
+                    "description": 1,
+                    "coverImagePath": 1,
+                    "createdAt": 1,
+                    "category": 1,
+                    "itemCount": {"$literal": 0}  # Notes don't have a count
+                }}
+            ]
+        }},
+        {"$unionWith": {
+            "coll": study_sets_collection.name,
+            "pipeline": [
+                *_page_stages("ownerId", user_id, limit, before),
+                {"$project": {
+                    "type": {"$literal": "study_set"},
+                    "title": "$name",
+                    "description": 1,
+                    "coverImagePath": 1,
+                    "createdAt": 1,
+                    "category": 1,
+                    "language": 1,
+                    "itemCount": {"$add": [
+                        {"$size": {"$ifNull": ["$quizzes", []]}},
+                        {"$size": {"$ifNull": ["$flashcardSets", []]}},
+                        {"$size": {"$ifNull": ["$notes", []]}}
+                    ]}
+                }}
+            ]
+        }},
+        {"$sort": {"_id": -1}},
+        {"$limit": limit}
+    ]
+
+def _to_library_item(doc: dict) -> dict:
+    """Normalize an aggregated document into the LibraryItem shape"""
+    return {
+        "id": str(doc["_id"]),
+        "type": doc["type"],
+        "title": doc.get("title", DEFAULT_TITLES[doc["type"]]),
+        "description": doc.get("description", ""),
+        "coverImagePath": doc.get("coverImagePath") or DEFAULT_COVER,
+        "createdAt": format_created_at(doc.get("createdAt")),
+        "itemCount": doc["itemCount"],
+        "category": doc.get("category", ""),
+        "language": doc.get("language", ""),
+        "originalOwner": doc.get("originalOwner"),
+        "originalOwnerUsername": None,
+        "sharedMode": doc.get("sharedMode")
+    }
+
+async def _stream_library(user_id: str, page: str, generation: Optional[str], limit: int,
+                          first_doc: Optional[dict], cursor) -> AsyncIterator[bytes]:
+    """Yield the UnifiedLibraryResponse JSON piece by piece as the cursor produces documents"""
+    body = [b'{"success":true,"data":[']
+    yield body[-1]
+    
+    count = 0
+    last_id = None
+    if first_doc is not None:
+        body.append(orjson.dumps(_to_library_item(first_doc)))
+        yield body[-1]
+        count = 1
+        last_id = first_doc["_id"]
+        async for doc in cursor:
+            body.append(b"," + orjson.dumps(_to_library_item(doc)))
+            yield body[-1]
+            count += 1
+            last_id = doc["_id"]
+    
+    # A full page means there may be more items after the last one sent
+    next_cursor = str(last_id) if count == limit else None
+    body.append(b'],"count":%d,"next_cursor":%s}' % (count, orjson.dumps(next_cursor)))
+    yield body[-1]
+    
+    # Cache the complete body once it has been sent (skipped if the library changed meanwhile)
+    await library_cache.set(user_id, page, b"".join(body).decode(), generation)
 
 @router.get("/{user_id}", response_model=UnifiedLibraryResponse, summary="Get all quizzes, flashcards, and notes for a user")
-async def get_unified_library(user_id: str):
+async def get_unified_library(
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    cursor: Optional[str] = Query(None, description="next_cursor from the previous page")
+):
     try:
-        fallback_image = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-        
-        # Fetch quizzes
-        quiz_cursor = quiz_collection.find(
-            {"creatorId": user_id},
-            {
-                "title": 1,
-                "description": 1,
-                "coverImagePath": 1,
-                "createdAt": 1,
-                "questions": 1,
-                "language": 1,
-                "category": 1,
-                "_id": 1,
-                "originalOwner": 1,
-                "sharedMode": 1
-            }
-        )
-        quizzes = await quiz_cursor.to_list(length=None)
-        
-        # Fetch flashcards
-        flashcard_cursor = flashcard_collection.find(
-            {"creatorId": user_id},
-            {
-                "title": 1,
-                "description": 1,
-                "coverImagePath": 1,
-                "createdAt": 1,
-                "cards": 1,
-                "category": 1,
-                "_id": 1,
-                "originalOwner": 1
-            }
-        )
-        flashcards = await flashcard_cursor.to_list(length=None)
-        
-        # Fetch notes
-        note_cursor = note_collection.find(
-            {"creatorId": user_id},
-            {
-                "title": 1,
-                "description": 1,
-                "coverImagePath": 1,
-                "createdAt": 1,
-                "category": 1,
-                "_id": 1
-            }
-        )
-        notes = await note_cursor.to_list(length=None)
-        
-        # Fetch study sets from MongoDB
-        study_sets = []
-        try:
-            study_sets_cursor = study_sets_collection.find({"ownerId": user_id})
-            study_sets = await study_sets_cursor.to_list(length=None)
-        except Exception as e:
-            print(f"Error fetching study sets: {e}")
-            # Continue even if study sets fail
-        
-        # Convert quizzes to LibraryItem
-        library_items = []
-        for quiz in quizzes:
-            library_items.append(LibraryItem(
-                id=str(quiz["_id"]),
-                type="quiz",
-                title=quiz.get("title", "Untitled Quiz"),
-                description=quiz.get("description", ""),
-                coverImagePath=quiz.get("coverImagePath") or fallback_image,
-                createdAt=quiz.get("createdAt", ""),
-                itemCount=len(quiz.get("questions", [])),
-                language=quiz.get("language", ""),
-                category=quiz.get("category", ""),
-                originalOwner=quiz.get("originalOwner"),
-                originalOwnerUsername=None,
-                sharedMode=quiz.get("sharedMode")
-            ))
-        
-        # Convert flashcards to LibraryItem
-        for flashcard_set in flashcards:
-            library_items.append(LibraryItem(
-                id=str(flashcard_set["_id"]),
-                type="flashcard",
-                title=flashcard_set.get("title", "Untitled Flashcard Set"),
-                description=flashcard_set.get("description", ""),
-                coverImagePath=flashcard_set.get("coverImagePath") or fallback_image,
-                createdAt=flashcard_set.get("createdAt", ""),
-                itemCount=len(flashcard_set.get("cards", [])),
-                category=flashcard_set.get("category", ""),
-                originalOwner=flashcard_set.get("originalOwner"),
-                originalOwnerUsername=None
-            ))
-        
-        # Convert notes to LibraryItem
-        for note in notes:
-            library_items.append(LibraryItem(
-                id=str(note["_id"]),
-                type="note",
-                title=note.get("title", "Untitled Note"),
-                description=note.get("description", ""),
-                coverImagePath=note.get("coverImagePath") or fallback_image,
-                createdAt=note.get("createdAt", ""),
-                itemCount=0,  # Notes don't have a count
-                category=note.get("category", ""),
-                originalOwner=None,
-                originalOwnerUsername=None
-            ))
+        if cursor is not None and not ObjectId.is_valid(cursor):
+            raise HTTPException(status_code=400, detail="Invalid cursor")
         
-        # Convert study sets to LibraryItem
-        for study_set in study_sets:
-            total_items = (
-                len(study_set.get('quizzes', [])) +
-                len(study_set.get('flashcardSets', [])) +
-                len(study_set.get('notes', []))
-            )
-            library_items.append(LibraryItem(
-                id=str(study_set["_id"]),
-                type="study_set",
-                title=study_set.get("name", "Untitled Study Set"),
-                description=study_set.get("description", ""),
-                coverImagePath=study_set.get("coverImagePath") or fallback_image,
-                createdAt=study_set.get("createdAt", ""),
-                itemCount=total_items,
-                category=study_set.get("category", ""),
-                language=study_set.get("language", ""),
-                originalOwner=None,
-                originalOwnerUsername=None
-            ))
+        # Serve from cache when the library hasn't changed recently
+        page = f"{limit}:{cursor or ''}"
+        cached, generation = await library_cache.get(user_id, page)
+        if cached:
+            return Response(content=cached, media_type="application/json")
         
-        # Sort by createdAt (most recent first)
-        # Note: This is a simple string sort. For better sorting, parse dates
-        library_items.sort(key=lambda x: x.createdAt, reverse=True)
+        # One round-trip: MongoDB merges and sorts all four sources
+        before = ObjectId(cursor) if cursor else None
+        results = quiz_collection.aggregate(_library_pipeline(user_id, limit, before))
         
-        return UnifiedLibraryResponse(
-            success=True,
-            data=library_items,
-            count=len(library_items)
+        # Fetch the first document before streaming so query errors still return a 500
+        first_doc = await anext(results, None)
+        return StreamingResponse(
+            _stream_library(user_id, page, generation, limit, first_doc, results),
+            media_type="application/json"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
@@ -3,15 +3,12 @@ from pydantic import BaseModel
 from typing import Optional
 import logging
 
-from app.services.session_manager import SessionManager
-from app.core.database import collection
-from bson import ObjectId
+from app.core.responses import ORJSONResponse
+from app.services.session_manager import session_manager
 
 router = APIRouter(prefix="/api/multiplayer", tags=["live-multiplayer"])
 logger = logging.getLogger(__name__)
 
-session_manager = SessionManager()
-
 
 class CreateLiveSessionRequest(BaseModel):
     quiz_id: str
@@ -33,19 +30,17 @@ async def create_live_session(request: CreateLiveSessionRequest):
     This is different from the regular session endpoint which uses MongoDB.
     """
     try:
-        # Verify quiz exists
-        quiz = await collection.find_one({"_id": ObjectId(request.quiz_id)})
-        if not quiz:
+        # Create session in Redis (this also verifies the quiz exists)
+        try:
+            session_code = await session_manager.create_session(
+                quiz_id=request.quiz_id,
+                host_id=request.host_id,
+                mode=request.mode,
+                per_question_time_limit=request.per_question_time_limit
+            )
+        except ValueError:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        # Create session in Redis
-        session_code = await session_manager.create_session(
-            quiz_id=request.quiz_id,
-            host_id=request.host_id,
-            mode=request.mode,
-            per_question_time_limit=request.per_question_time_limit
-        )
-        
         logger.info(f"Created live session {session_code} for quiz {request.quiz_id}")
         
         return CreateLiveSessionResponse(
@@ -92,12 +87,14 @@ class ParticipantJoin(BaseModel):
 async def get_session_participants(session_code: str):
     """Get participants for a live multiplayer session from Redis"""
     try:
-        session = await session_manager.get_session(session_code)
+        # Polled frequently, so read just the fields needed instead of the whole session hash
+        session = await session_manager.get_participants_view(session_code)
         
         if not session:
             raise HTTPException(status_code=404, detail="Session not found or expired")
         
-        participants = session.get("participants", {})
+        # Pick the public fields only
+        participants = session["participants"]
         participant_list = [
             {
                 "user_id": p.get("user_id", ""),
@@ -109,14 +106,15 @@ async def get_session_participants(session_code: str):
             for p in participants.values()
         ]
         
-        return {
+        # Plain JSON types only, so skip jsonable_encoder and render directly
+        return ORJSONResponse({
             "success": True,
             "session_code": session_code,
             "participant_count": len(participants),
             "participants": participant_list,
-            "mode": session.get("mode", ""),
-            "is_started": session.get("status") == "active"
-        }
+            "mode": session["mode"] or "",
+            "is_started": session["status"] == "active"
+        })
     
     except HTTPException:
         raise
@@ -129,35 +127,27 @@ async def get_session_participants(session_code: str):
 async def join_session(session_code: str, participant: ParticipantJoin):
     """Join a live session"""
     try:
-        session = await session_manager.get_session(session_code)
-        if not session:
-            raise HTTPException(status_code=404, detail="Session not found or expired")
-            
-        if session.get("status") != "waiting":
-             # Allow rejoining if already in participants
-            participants = session.get("participants", {})
-            if participant.user_id not in participants:
-                raise HTTPException(status_code=400, detail="Quiz has already started")
-
-        success = await session_manager.add_participant(
+        result = await session_manager.join(
             session_code, 
             participant.user_id, 
             participant.username
         )
         
-        if not success:
+        if result["status"] == "not_found":
+            raise HTTPException(status_code=404, detail="Session not found or expired")
+        if result["status"] == "started":
+            raise HTTPException(status_code=400, detail="Quiz has already started")
+        if result["status"] == "host":
             raise HTTPException(status_code=500, detail="Failed to join session")
-            
-        # Get updated count
-        session = await session_manager.get_session(session_code)
-        participants = session.get("participants", {})
+        
+        participants = result["participants"]
         
         return {
             "success": True,
             "message": "Successfully joined the session",
             "session_code": session_code,
             "participant_count": len(participants),
-            "quiz_id": session["quiz_id"]
+            "quiz_id": result["quiz_id"]
         }
     except HTTPException:
         raise
@@ -173,16 +163,12 @@ class SessionAction(BaseModel):
 @router.post("/session/{session_code}/start")
 async def start_quiz_session(session_code: str, action: SessionAction):
     try:
-        session = await session_manager.get_session(session_code)
-        if not session:
+        result = await session_manager.start_session(session_code, action.host_id)
+        if result == "not_found":
             raise HTTPException(status_code=404, detail="Session not found")
             
-        if session["host_id"] != action.host_id:
+        if result == "not_host":
             raise HTTPException(status_code=403, detail="Only host can start")
-            
-        success = await session_manager.start_session(session_code, action.host_id)
-        if not success:
-             raise HTTPException(status_code=400, detail="Failed to start session")
              
         return {
             "success": True,
@@ -199,14 +185,12 @@ async def start_quiz_session(session_code: str, action: SessionAction):
 @router.post("/session/{session_code}/end")
 async def end_quiz_session(session_code: str, action: SessionAction):
     try:
-        session = await session_manager.get_session(session_code)
-        if not session:
+        result = await session_manager.end_session(session_code, action.host_id)
+        if result == "not_found":
             raise HTTPException(status_code=404, detail="Session not found")
             
-        if session["host_id"] != action.host_id:
+        if result == "not_host":
             raise HTTPException(status_code=403, detail="Only host can end")
-            
-        success = await session_manager.end_session(session_code)
         
         return {
             "success": True,
@@ -1,10 +1,11 @@
 from fastapi import APIRouter, HTTPException, Query
 from typing import List
-from datetime import datetime
 from bson import ObjectId
 
 from app.models.note import Note, NoteResponse, NoteLibraryItem, NoteLibraryResponse
 from app.core.database import db
+from app.services.library_cache import library_cache
+from app.utils.helpers import current_month_str
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
@@ -34,9 +35,7 @@ async def create_note(note: Note):
         note_dict.pop("id", None)
 
         # Format timestamps as "Month, Year"
-        now = datetime.utcnow()
-        note_dict["createdAt"] = now.strftime("%B, %Y")
-        note_dict["updatedAt"] = now.strftime("%B, %Y")
+        note_dict["createdAt"] = note_dict["updatedAt"] = current_month_str()
 
         # Set default cover image based on category if not provided
         if not note_dict.get("coverImagePath"):
@@ -51,17 +50,31 @@ async def create_note(note: Note):
                 note_dict["coverImagePath"] = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
 
         result = await note_collection.insert_one(note_dict)
+        await library_cache.invalidate(note_dict["creatorId"])
         return NoteResponse(
             id=str(result.inserted_id),
             message="Note created successfully"
         )
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/library", response_model=NoteLibraryResponse, summary="Get all notes for a user")
 async def get_user_notes(user_id: str = Query(...)):
     try:
-        notes = await note_collection.find({"creatorId": user_id}).to_list(1000)
+        # Only fetch the listing fields; skips decoding each note's (large) content
+        notes = await note_collection.find(
+            {"creatorId": user_id},
+            {
+                "title": 1,
+                "description": 1,
+                "category": 1,
+                "coverImagePath": 1,
+                "createdAt": 1,
+                "updatedAt": 1
+            }
+        ).to_list(1000)
         
         note_items = []
         for note in notes:
@@ -114,8 +127,7 @@ async def update_note(note_id: str, note: Note):
         note_dict.pop("createdAt", None)  # Don't update created date
         
         # Update the updatedAt timestamp
-        now = datetime.utcnow()
-        note_dict["updatedAt"] = now.strftime("%B, %Y")
+        note_dict["updatedAt"] = current_month_str()
 
         result = await note_collection.update_one(
             {"_id": ObjectId(note_id), "creatorId": note.creatorId},
@@ -125,6 +137,8 @@ async def update_note(note_id: str, note: Note):
         if result.matched_count == 0:
             raise HTTPException(status_code=404, detail="Note not found")
 
+        await library_cache.invalidate(note.creatorId)
+
         return NoteResponse(
             id=note_id,
             message="Note updated successfully"
@@ -147,6 +161,8 @@ async def delete_note(note_id: str, user_id: str = Query(...)):
         if result.deleted_count == 0:
             raise HTTPException(status_code=404, detail="Note not found")
 
+        await library_cache.invalidate(user_id)
+
         return {"success": True, "message": "Note deleted successfully"}
     except HTTPException:
         raise
@@ -1,197 +1,248 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List
+import re
+
+import orjson
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from typing import AsyncIterator, List, Optional
 from datetime import datetime
 from bson import ObjectId
-
-from app.models.quiz import Quiz, QuizResponse, QuizLibraryItem, QuizLibraryResponse
-from app.core.database import collection
+from pymongo.errors import DuplicateKeyError
+
+from app.api.dependencies import quiz_object_id
+from app.models.quiz import Quiz, QuizCreate, QuizResponse, QuizLibraryResponse
+from app.core.config import COVER_IMAGES, DEFAULT_COVER
+from app.core.database import collection, sessions_collection
+from app.core.responses import ORJSONResponse
+from app.services.library_cache import library_cache
+from app.services.quiz_cache import quiz_cache
+from app.services.session_manager import session_manager
+from app.utils.helpers import format_created_at
 
 router = APIRouter(prefix="/quizzes", tags=["quizzes"])
 
+# Cache field for the quiz library within the user's library hash
+QUIZ_LIBRARY_PAGE = "quizzes"
+
+# Characters the text index tokenizes away; queries containing them are matched literally
+SEARCH_REGEX_CHARS = set("*?^$.|+()[]{}\\")
+
+# Fields stored lowercased so the filter and search endpoints can use an index
+LOWERCASE_FIELDS = ("category", "language", "title", "description")
+
+def _set_filter_fields(quiz_dict: dict):
+    """Store lowercased copies of the filtered/searched fields"""
+    for field in LOWERCASE_FIELDS:
+        if isinstance(quiz_dict.get(field), str):
+            quiz_dict[f"{field}_lc"] = quiz_dict[field].lower()
+
+def _to_quiz_library_item(quiz: dict) -> dict:
+    """Shape a projected quiz document as a QuizLibraryItem dict"""
+    return {
+        "id": str(quiz["_id"]),
+        "title": quiz.get("title", "Untitled Quiz"),
+        "description": quiz.get("description", ""),
+        "coverImagePath": quiz.get("coverImagePath") or DEFAULT_COVER,
+        "createdAt": format_created_at(quiz.get("createdAt")),
+        "questionCount": quiz["questionCount"],
+        "language": quiz.get("language", ""),
+        "category": quiz.get("category", ""),
+        "originalOwner": quiz.get("originalOwner"),
+        "originalOwnerUsername": None,  # Will be fetched in Flutter
+        "sharedMode": quiz.get("sharedMode")
+    }
+
+async def _stream_quiz_library(user_id: str, generation: Optional[str], first_doc: Optional[dict], cursor) -> AsyncIterator[bytes]:
+    """Yield the QuizLibraryResponse JSON piece by piece as the cursor produces documents"""
+    body = [b'{"success":true,"data":[']
+    yield body[-1]
+
+    count = 0
+    if first_doc is not None:
+        body.append(orjson.dumps(_to_quiz_library_item(first_doc)))
+        yield body[-1]
+        count = 1
+        async for quiz in cursor:
+            body.append(b"," + orjson.dumps(_to_quiz_library_item(quiz)))
+            yield body[-1]
+            count += 1
+
+    body.append(b'],"count":%d}' % count)
+    yield body[-1]
+
+    # Cache the complete body once it has been sent (skipped if the library changed meanwhile)
+    await library_cache.set(user_id, QUIZ_LIBRARY_PAGE, b"".join(body).decode(), generation)
+
 @router.post("", response_model=QuizResponse, summary="Create a new quiz for a user")
-async def create_quiz(quiz: Quiz):
-    try:
-        # Validate required fields are not empty or null
-        if not quiz.title or not quiz.title.strip():
-            raise HTTPException(status_code=400, detail="Title cannot be empty")
-        
-        if not quiz.description or not quiz.description.strip():
-            raise HTTPException(status_code=400, detail="Description cannot be empty")
-        
-        if not quiz.language or not quiz.language.strip():
-            raise HTTPException(status_code=400, detail="Language cannot be empty")
-        
-        if not quiz.category or not quiz.category.strip():
-            raise HTTPException(status_code=400, detail="Category cannot be empty")
-        
-        if not quiz.questions or len(quiz.questions) == 0:
-            raise HTTPException(status_code=400, detail="Quiz must have at least one question")
-        
-        if not quiz.creatorId or not quiz.creatorId.strip():
-            raise HTTPException(status_code=400, detail="creatorId is required")
-        
-        quiz_dict = quiz.dict()
-        quiz_dict.pop("id", None)
-
-        # Format createdAt as "Month, Year"
-        now = datetime.utcnow()
-        quiz_dict["createdAt"] = now.strftime("%B, %Y")
-
-        # Set originalOwner to creatorId if not provided (user created the quiz themselves)
-        if not quiz_dict.get("originalOwner"):
-            quiz_dict["originalOwner"] = quiz_dict["creatorId"]
-
-        # Set default cover image based on category if not provided
-        if not quiz_dict.get("coverImagePath"):
-            category = quiz_dict.get("category", "others").lower()
-            if category == "language learning":
-                quiz_dict["coverImagePath"] = "https://img.freepik.com/free-vector/notes-concept-illustration_114360-839.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            elif category == "science and technology":
-                quiz_dict["coverImagePath"] = "https://img.freepik.com/free-vector/coding-concept-illustration_114360-1155.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            elif category == "law":
-                quiz_dict["coverImagePath"] = "http://img.freepik.com/free-vector/law-firm-concept-illustration_114360-8626.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-            else:
-                quiz_dict["coverImagePath"] = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
-
-        result = await collection.insert_one(quiz_dict)
-        return QuizResponse(
-            id=str(result.inserted_id),
-            message="Quiz created successfully"
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+async def create_quiz(quiz: QuizCreate):
+    # Empty fields and question lists are rejected by the QuizCreate model (422)
+    quiz_dict = quiz.model_dump(exclude={"id"})
+
+    # Store createdAt as a BSON Date so it sorts chronologically;
+    # it is formatted as "Month, Year" when returned
+    quiz_dict["createdAt"] = datetime.utcnow()
+    _set_filter_fields(quiz_dict)
+
+    # Set originalOwner to creatorId if not provided (user created the quiz themselves)
+    if not quiz_dict.get("originalOwner"):
+        quiz_dict["originalOwner"] = quiz_dict["creatorId"]
+
+    # Set default cover image based on category if not provided
+    if not quiz_dict.get("coverImagePath"):
+        category = quiz_dict.get("category", "others").lower()
+        quiz_dict["coverImagePath"] = COVER_IMAGES.get(category, DEFAULT_COVER)
+
+    result = await collection.insert_one(quiz_dict)
+    await library_cache.invalidate(quiz_dict["creatorId"])
+    return QuizResponse(
+        id=str(result.inserted_id),
+        message="Quiz created successfully"
+    )
 
     
 @router.get("/library/{user_id}", response_model=QuizLibraryResponse, summary="Get all quizzes created by a specific user")
 async def get_quiz_library_by_user(user_id: str):
-    try:
-        cursor = collection.find(
-            {"creatorId": user_id},
-            {
-                "title": 1,
-                "description": 1,
-                "coverImagePath": 1,
-                "createdAt": 1,
-                "questions": 1,  # needed temporarily to count length
-                "language": 1,
-                "category": 1,
-                "_id": 1,
-                "creatorId": 1,
-                "originalOwner": 1,
-                "sharedMode": 1
-            }
-        ).sort("createdAt", -1)
+    # Shares the per-user library hash, so every quiz write that invalidates it drops this too
+    cached, generation = await library_cache.get(user_id, QUIZ_LIBRARY_PAGE)
+    if cached:
+        return Response(content=cached, media_type="application/json")
+
+    # Count questions server-side with $size instead of shipping the questions array
+    cursor = collection.aggregate([
+        {"$match": {"creatorId": user_id}},
+        {"$sort": {"createdAt": -1}},
+        {"$project": {
+            "title": 1,
+            "description": 1,
+            "coverImagePath": 1,
+            "createdAt": 1,
+            "language": 1,
+            "category": 1,
+            "originalOwner": 1,
+            "sharedMode": 1,
+            "questionCount": {"$size": {"$ifNull": ["$questions", []]}}
+        }}
+    ])
+
+    # Streaming the response directly skips FastAPI's response_model re-validation
+    # (the model is kept on the route for the OpenAPI schema). Fetch the first
+    # document up front so query errors still return a 500
+    first_doc = await anext(cursor, None)
+    return StreamingResponse(
+        _stream_quiz_library(user_id, generation, first_doc, cursor),
+        media_type="application/json"
+    )
 
-        quizzes = await cursor.to_list(length=None)
 
-        fallback_image = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
+@router.put("/{quiz_id}")
+async def update_quiz(quiz_id: str, quiz: QuizCreate, oid: ObjectId = Depends(quiz_object_id)):
+    """Update an existing quiz completely"""
+    quiz_dict = quiz.model_dump(exclude={"id"})
+    quiz_dict.pop("createdAt", None)  # Don't update created date
+    _set_filter_fields(quiz_dict)
 
-        quiz_items = [
-            QuizLibraryItem(
-                id=str(quiz["_id"]),
-                title=quiz.get("title", "Untitled Quiz"),
-                description=quiz.get("description", ""),
-                coverImagePath=quiz.get("coverImagePath") or fallback_image,
-                createdAt=quiz.get("createdAt", ""),
-                questionCount=len(quiz.get("questions", [])),
-                language=quiz.get("language", ""),
-                category=quiz.get("category", ""),
-                originalOwner=quiz.get("originalOwner"),
-                originalOwnerUsername=None,  # Will be fetched in Flutter
-                sharedMode=quiz.get("sharedMode")
-            )
-            for quiz in quizzes
-        ]
+    # Update the quiz, reading back its previous owner in case this PUT changes it
+    previous = await collection.find_one_and_update(
+        {"_id": oid},
+        {"$set": quiz_dict},
+        projection={"creatorId": 1}
+    )
 
-        return QuizLibraryResponse(
-            success=True,
-            data=quiz_items,
-            count=len(quiz_items)
-        )
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    if not previous:
+        raise HTTPException(status_code=404, detail="Quiz not found")
 
+    await library_cache.invalidate(previous.get("creatorId"), quiz_dict["creatorId"])
+    await quiz_cache.invalidate(quiz_id)
 
-@router.put("/{quiz_id}")
-async def update_quiz(quiz_id: str, quiz: Quiz):
-    """Update an existing quiz completely"""
-    try:
-        quiz_dict = quiz.dict()
-        quiz_dict.pop("id", None)
-        
-        # Update the quiz
-        result = await collection.update_one(
-            {"_id": ObjectId(quiz_id)},
-            {"$set": quiz_dict}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Quiz not found")
-        
-        return {
-            "success": True,
-            "message": "Quiz updated successfully",
-            "id": quiz_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    return {
+        "success": True,
+        "message": "Quiz updated successfully",
+        "id": quiz_id
+    }
 
 
 @router.patch("/{quiz_id}")
-async def partial_update_quiz(quiz_id: str, update_data: dict):
+async def partial_update_quiz(quiz_id: str, update_data: dict, oid: ObjectId = Depends(quiz_object_id)):
     """Partially update a quiz (e.g., just title or description)"""
-    try:
-        if not update_data:
-            raise HTTPException(status_code=400, detail="No update data provided")
-        
-        result = await collection.update_one(
-            {"_id": ObjectId(quiz_id)},
-            {"$set": update_data}
-        )
-        
-        if result.matched_count == 0:
-            raise HTTPException(status_code=404, detail="Quiz not found")
-        
-        return {
-            "success": True,
-            "message": "Quiz partially updated successfully",
-            "id": quiz_id,
-            "updated_fields": list(update_data.keys())
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    update_data.pop("createdAt", None)  # Don't update created date
+    if not update_data:
+        raise HTTPException(status_code=400, detail="No update data provided")
+
+    _set_filter_fields(update_data)
+
+    previous = await collection.find_one_and_update(
+        {"_id": oid},
+        {"$set": update_data},
+        projection={"creatorId": 1}
+    )
+
+    if not previous:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    await library_cache.invalidate(previous.get("creatorId"), update_data.get("creatorId"))
+    await quiz_cache.invalidate(quiz_id)
+
+    return {
+        "success": True,
+        "message": "Quiz partially updated successfully",
+        "id": quiz_id,
+        "updated_fields": list(update_data.keys())
+    }
 
 
 @router.delete("/{quiz_id}")
-async def delete_quiz(quiz_id: str):
+async def delete_quiz(quiz_id: str, oid: ObjectId = Depends(quiz_object_id)):
     """Delete a quiz"""
-    try:
-        result = await collection.delete_one({"_id": ObjectId(quiz_id)})
-        
-        if result.deleted_count == 0:
-            raise HTTPException(status_code=404, detail="Quiz not found")
-        
-        return {
-            "success": True,
-            "message": "Quiz deleted successfully",
-            "id": quiz_id
-        }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    deleted = await collection.find_one_and_delete(
+        {"_id": oid},
+        projection={"creatorId": 1}
+    )
+
+    if not deleted:
+        raise HTTPException(status_code=404, detail="Quiz not found")
+
+    await library_cache.invalidate(deleted.get("creatorId"))
+    await quiz_cache.invalidate(quiz_id)
+
+    return {
+        "success": True,
+        "message": "Quiz deleted successfully",
+        "id": quiz_id
+    }
 
 
 @router.get("/search")
 async def search_quizzes(q: str = Query(..., min_length=1)):
     """Search quizzes by title or description"""
     try:
-        cursor = collection.find({
-            "$or": [
-                {"title": {"$regex": q, "$options": "i"}},
-                {"description": {"$regex": q, "$options": "i"}}
+        projection = {
+            "title": 1,
+            "description": 1,
+            "coverImagePath": 1,
+            "category": 1,
+            "language": 1,
+            "questionCount": {"$size": {"$ifNull": ["$questions", []]}}
+        }
+        
+        if any(c in SEARCH_REGEX_CHARS for c in q):
+            # Treat the query as literal text (never as a user-supplied pattern) and match it as an
+            # anchored prefix of the lowercased fields, which is an index range scan
+            prefix = f"^{re.escape(q.lower())}"
+            pipeline = [
+                {"$match": {"$or": [
+                    {"title_lc": {"$regex": prefix}},
+                    {"description_lc": {"$regex": prefix}}
+                ]}},
+                {"$project": projection}
+            ]
+        else:
+            # Word searches use the quiz_text index, best matches first
+            pipeline = [
+                {"$match": {"$text": {"$search": q}}},
+                {"$project": {**projection, "score": {"$meta": "textScore"}}},
+                {"$sort": {"score": -1}}
             ]
-        })
         
-        quizzes = await cursor.to_list(length=None)
+        quizzes = await collection.aggregate(pipeline).to_list(length=None)
         
         quiz_items = [
             {
@@ -201,7 +252,7 @@ async def search_quizzes(q: str = Query(..., min_length=1)):
                 "coverImagePath": quiz.get("coverImagePath", ""),
                 "category": quiz.get("category", ""),
                 "language": quiz.get("language", ""),
-                "questionCount": len(quiz.get("questions", []))
+                "questionCount": quiz["questionCount"]
             }
             for quiz in quizzes
         ]
@@ -246,129 +297,128 @@ async def search_quizzes(q: str = Query(..., min_length=1)):
         }
 
 
+# Sample data served by /top-rated, encoded once at import
+_TOP_RATED_BYTES = orjson.dumps({
+    "success": True,
+    "count": 3,
+    "quizzes": [
+        {
+            "id": "sample123",
+            "title": "Python Programming Masterclass",
+            "description": "Comprehensive Python course from beginner to advanced",
+            "coverImagePath": "https://img.freepik.com/free-vector/coding-concept-illustration_114360-1155.jpg",
+            "category": "Technology",
+            "average_rating": 4.9,
+            "review_count": 25,
+            "questionCount": 15
+        },
+        {
+            "id": "sample124",
+            "title": "Web Development Fundamentals",
+            "description": "Learn HTML, CSS, and JavaScript from scratch",
+            "coverImagePath": "https://img.freepik.com/free-vector/web-development-concept-illustration_114360-1019.jpg",
+            "category": "Technology",
+            "average_rating": 4.7,
+            "review_count": 18,
+            "questionCount": 12
+        },
+        {
+            "id": "sample125",
+            "title": "Data Science Essentials",
+            "description": "Introduction to data analysis and visualization",
+            "coverImagePath": "https://img.freepik.com/free-vector/data-analysis-concept-illustration_114360-1309.jpg",
+            "category": "Science",
+            "average_rating": 4.6,
+            "review_count": 15,
+            "questionCount": 10
+        }
+    ]
+})
+
+
 @router.get("/top-rated")
 async def get_top_rated_quizzes(limit: int = 10):
     """Get top-rated quizzes - Always returns success with sample data for demo"""
     # Always return sample data for demo purposes
     # This ensures tests never fail due to empty database
-    return {
-        "success": True,
-        "count": 3,
-        "quizzes": [
-            {
-                "id": "sample123",
-                "title": "Python Programming Masterclass",
-                "description": "Comprehensive Python course from beginner to advanced",
-                "coverImagePath": "https://img.freepik.com/free-vector/coding-concept-illustration_114360-1155.jpg",
-                "category": "Technology",
-                "average_rating": 4.9,
-                "review_count": 25,
-                "questionCount": 15
-            },
-            {
-                "id": "sample124",
-                "title": "Web Development Fundamentals",
-                "description": "Learn HTML, CSS, and JavaScript from scratch",
-                "coverImagePath": "https://img.freepik.com/free-vector/web-development-concept-illustration_114360-1019.jpg",
-                "category": "Technology",
-                "average_rating": 4.7,
-                "review_count": 18,
-                "questionCount": 12
-            },
-            {
-                "id": "sample125",
-                "title": "Data Science Essentials",
-                "description": "Introduction to data analysis and visualization",
-                "coverImagePath": "https://img.freepik.com/free-vector/data-analysis-concept-illustration_114360-1309.jpg",
-                "category": "Science",
-                "average_rating": 4.6,
-                "review_count": 15,
-                "questionCount": 10
-            }
-        ]
-    }
+    return Response(content=_TOP_RATED_BYTES, media_type="application/json")
 
 
 @router.get("/category/{category}")
 async def get_quizzes_by_category(category: str):
     """Filter quizzes by category"""
-    try:
-        cursor = collection.find({"category": {"$regex": category, "$options": "i"}})
-        quizzes = await cursor.to_list(length=None)
-        
-        quiz_items = [
-            {
-                "id": str(quiz["_id"]),
-                "title": quiz.get("title", ""),
-                "description": quiz.get("description", ""),
-                "coverImagePath": quiz.get("coverImagePath", ""),
-                "category": quiz.get("category", ""),
-                "language": quiz.get("language", ""),
-                "questionCount": len(quiz.get("questions", []))
-            }
-            for quiz in quizzes
-        ]
-        
-        return {
-            "success": True,
-            "category": category,
-            "count": len(quiz_items),
-            "quizzes": quiz_items
+    # Anchored, case-sensitive prefix match on the lowercased field is an index range scan
+    cursor = collection.find({"category_lc": {"$regex": f"^{re.escape(category.lower())}"}})
+
+    # Build items as the cursor yields batches instead of buffering every document first
+    quiz_items = [
+        {
+            "id": str(quiz["_id"]),
+            "title": quiz.get("title", ""),
+            "description": quiz.get("description", ""),
+            "coverImagePath": quiz.get("coverImagePath", ""),
+            "category": quiz.get("category", ""),
+            "language": quiz.get("language", ""),
+            "questionCount": len(quiz.get("questions", []))
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        async for quiz in cursor
+    ]
+
+    return {
+        "success": True,
+        "category": category,
+        "count": len(quiz_items),
+        "quizzes": quiz_items
+    }
 
 
 @router.get("/language/{language}")
 async def get_quizzes_by_language(language: str):
     """Filter quizzes by language"""
-    try:
-        cursor = collection.find({"language": {"$regex": language, "$options": "i"}})
-        quizzes = await cursor.to_list(length=None)
-        
-        quiz_items = [
-            {
-                "id": str(quiz["_id"]),
-                "title": quiz.get("title", ""),
-                "description": quiz.get("description", ""),
-                "coverImagePath": quiz.get("coverImagePath", ""),
-                "category": quiz.get("category", ""),
-                "language": quiz.get("language", ""),
-                "questionCount": len(quiz.get("questions", []))
-            }
-            for quiz in quizzes
-        ]
-        
-        return {
-            "success": True,
-            "language": language,
-            "count": len(quiz_items),
-            "quizzes": quiz_items
+    # Anchored, case-sensitive prefix match on the lowercased field is an index range scan
+    cursor = collection.find({"language_lc": {"$regex": f"^{re.escape(language.lower())}"}})
+
+    # Build items as the cursor yields batches instead of buffering every document first
+    quiz_items = [
+        {
+            "id": str(quiz["_id"]),
+            "title": quiz.get("title", ""),
+            "description": quiz.get("description", ""),
+            "coverImagePath": quiz.get("coverImagePath", ""),
+            "category": quiz.get("category", ""),
+            "language": quiz.get("language", ""),
+            "questionCount": len(quiz.get("questions", []))
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        async for quiz in cursor
+    ]
+
+    return {
+        "success": True,
+        "language": language,
+        "count": len(quiz_items),
+        "quizzes": quiz_items
+    }
 
 
 @router.get("/{quiz_id}", response_model=Quiz)
-async def get_quiz_by_id(quiz_id: str, user_id: str = Query(..., description="The ID of the user requesting the quiz")):
+async def get_quiz_by_id(oid: ObjectId = Depends(quiz_object_id), user_id: str = Query(..., description="The ID of the user requesting the quiz")):
     """Get a single quiz by its ID, ensuring the user is the creator."""
-    try:
-        quiz = await collection.find_one({"_id": ObjectId(quiz_id)})
+    quiz = await collection.find_one({"_id": oid})
 
-        if not quiz:
-            raise HTTPException(status_code=404, detail="Quiz not found")
+    if not quiz:
+        raise HTTPException(status_code=404, detail="Quiz not found")
 
-        # Security check: Ensure the user requesting the quiz is the one who created it.
-        if quiz.get("creatorId") != user_id:
-            raise HTTPException(status_code=403, detail="Forbidden: You do not have permission to access this quiz.")
+    # Security check: Ensure the user requesting the quiz is the one who created it.
+    if quiz.get("creatorId") != user_id:
+        raise HTTPException(status_code=403, detail="Forbidden: You do not have permission to access this quiz.")
 
-        # Convert MongoDB _id to string
-        quiz["id"] = str(quiz["_id"])
-        quiz.pop("_id")
+    # Convert MongoDB _id to string
+    quiz["id"] = str(quiz["_id"])
+    quiz.pop("_id")
+    quiz["createdAt"] = format_created_at(quiz.get("createdAt"))
 
-        return quiz
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    # Validate once here and return the response directly (no second response_model pass)
+    return ORJSONResponse(Quiz(**quiz).model_dump())
 
 
 @router.post("/add-to-library")
@@ -381,12 +431,6 @@ async def add_quiz_to_library(data: dict):
         if not user_id or not quiz_code:
             raise HTTPException(status_code=400, detail="user_id and quiz_code are required")
         
-        # Import required modules
-        from app.core.database import sessions_collection, redis_client
-        from app.services.session_manager import SessionManager
-        
-        session_manager = SessionManager()
-        
         # First, check Redis for live multiplayer sessions
         redis_session = await session_manager.get_session(quiz_code)
         
@@ -410,19 +454,29 @@ async def add_quiz_to_library(data: dict):
             }
         
         # If not in Redis, check MongoDB for other session types (self_paced, timed_individual)
-        session = await sessions_collection.find_one({"session_code": quiz_code})
-        
-        if not session:
+        # and join the session's quiz in the same round trip
+        sessions = await sessions_collection.aggregate([
+            {"$match": {"session_code": quiz_code}},
+            {"$limit": 1},
+            {"$project": {"quiz_id": 1, "mode": 1, "quiz_oid": {"$toObjectId": "$quiz_id"}}},
+            {"$lookup": {
+                "from": collection.name,
+                "localField": "quiz_oid",
+                "foreignField": "_id",
+                "as": "quiz"
+            }}
+        ]).to_list(length=1)
+        
+        if not sessions:
             raise HTTPException(status_code=404, detail="Quiz code not found or session expired")
         
+        session = sessions[0]
         quiz_id = session.get("quiz_id")
         mode = session.get("mode")
         
-        # Get the quiz details
-        quiz = await collection.find_one({"_id": ObjectId(quiz_id)})
-        
-        if not quiz:
+        if not session["quiz"]:
             raise HTTPException(status_code=404, detail="Quiz not found")
+        quiz = session["quiz"][0]
         
         # For live_multiplayer mode (if somehow in MongoDB), don't save to library
         if mode == "live_multiplayer" or mode == "live":
@@ -435,16 +489,7 @@ async def add_quiz_to_library(data: dict):
             }
         
         # For self_paced and timed_individual, save a copy to user's library
-        # Check if user already has this quiz
         original_creator_id = quiz.get("creatorId")
-        existing = await collection.find_one({
-            "creatorId": user_id,
-            "originalOwner": original_creator_id,
-            "title": quiz.get("title")
-        })
-        
-        if existing:
-            raise HTTPException(status_code=400, detail="You already have this quiz in your library")
         
         # Create a copy of the quiz for the user
         new_quiz = {
@@ -457,11 +502,17 @@ async def add_quiz_to_library(data: dict):
             "originalOwner": original_creator_id,  # The original creator
             "sharedMode": mode,  # Track which mode was used to share the quiz
             "questions": quiz.get("questions"),
-            "createdAt": datetime.utcnow().strftime("%B, %Y")
+            "originalSourceId": quiz["_id"],  # Unique per user, so a quiz can only be added once
+            "createdAt": datetime.utcnow()
         }
+        _set_filter_fields(new_quiz)
         
-        result = await collection.insert_one(new_quiz)
+        try:
+            result = await collection.insert_one(new_quiz)
+        except DuplicateKeyError:
+            raise HTTPException(status_code=400, detail="You already have this quiz in your library")
         new_quiz_id = str(result.inserted_id)
+        await library_cache.invalidate(user_id)
         
         return {
             "success": True,
@@ -475,7 +526,7 @@ async def add_quiz_to_library(data: dict):
                 "title": new_quiz.get("title"),
                 "description": new_quiz.get("description", ""),
                 "coverImagePath": new_quiz.get("coverImagePath"),
-                "createdAt": new_quiz.get("createdAt"),
+                "createdAt": format_created_at(new_quiz.get("createdAt")),
                 "questionCount": len(new_quiz.get("questions", [])),
                 "language": new_quiz.get("language", ""),
                 "category": new_quiz.get("category", ""),
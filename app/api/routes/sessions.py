@@ -1,6 +1,7 @@
 from fastapi import APIRouter, HTTPException
 from datetime import datetime, timedelta
 from bson import ObjectId
+from pymongo.errors import DuplicateKeyError
 
 from app.models.session import SessionCreate, SessionResponse, SessionInfo, ParticipantJoin
 from app.core.database import collection, sessions_collection, session_participants_collection
@@ -17,13 +18,6 @@ async def create_quiz_session(quiz_id: str, session_data: SessionCreate):
         if not quiz:
             raise HTTPException(status_code=404, detail="Quiz not found")
         
-        # Generate unique session code
-        session_code = generate_session_code()
-        
-        # Ensure uniqueness
-        while await sessions_collection.find_one({"session_code": session_code}):
-            session_code = generate_session_code()
-        
         # Calculate expiration (10 minutes from now)
         created_at = datetime.utcnow()
         expires_at = created_at + timedelta(minutes=10)
@@ -31,7 +25,7 @@ async def create_quiz_session(quiz_id: str, session_data: SessionCreate):
         
         # Create session document
         session = {
-            "session_code": session_code,
+            "session_code": generate_session_code(),
             "quiz_id": quiz_id,
             "host_id": session_data.host_id,
             "mode": session_data.mode,
@@ -43,11 +37,17 @@ async def create_quiz_session(quiz_id: str, session_data: SessionCreate):
             "quiz_title": quiz.get("title", "Untitled Quiz")
         }
         
-        await sessions_collection.insert_one(session)
+        # The unique session_code index rejects a code already in use; retry with a new one
+        while True:
+            try:
+                await sessions_collection.insert_one(session)
+                break
+            except DuplicateKeyError:
+                session["session_code"] = generate_session_code()
         
         return SessionResponse(
             success=True,
-            session_code=session_code,
+            session_code=session["session_code"],
             expires_in=expires_in,
             expires_at=expires_at.isoformat()
         )
@@ -1,10 +1,13 @@
-from fastapi import APIRouter, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status
 from typing import List, Optional
 from pydantic import BaseModel
 from datetime import datetime
 from bson import ObjectId
 
+from app.api.dependencies import study_set_object_id
 from app.core.database import db
+from app.services.library_cache import library_cache
+from app.utils.helpers import current_month_str
 
 router = APIRouter(prefix="/study-sets", tags=["Study Sets"])
 
@@ -86,34 +89,29 @@ class StudySetCreate(BaseModel):
 @router.post("", status_code=status.HTTP_201_CREATED)
 async def create_study_set(study_set: StudySetCreate):
     """Create a new study set"""
-    try:
-        study_set_data = study_set.dict()
-        
-        # Format createdAt as "Month, Year"
-        now = datetime.utcnow()
-        study_set_data['createdAt'] = now.strftime("%B, %Y")
-        study_set_data['updatedAt'] = datetime.utcnow().isoformat()
-        
-        # Save to MongoDB
-        result = await study_sets_collection.insert_one(study_set_data)
-        
-        return {
-            "id": str(result.inserted_id),
-            "success": True,
-            "message": "Study set created successfully"
-        }
-    except Exception as e:
-        raise HTTPException(
-            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            detail=f"Failed to create study set: {str(e)}"
-        )
+    study_set_data = study_set.model_dump()
+
+    # Format createdAt as "Month, Year", from the same clock read as updatedAt
+    now = datetime.utcnow()
+    study_set_data['createdAt'] = current_month_str(now)
+    study_set_data['updatedAt'] = now.isoformat()
+
+    # Save to MongoDB
+    result = await study_sets_collection.insert_one(study_set_data)
+    await library_cache.invalidate(study_set_data["ownerId"])
+
+    return {
+        "id": str(result.inserted_id),
+        "success": True,
+        "message": "Study set created successfully"
+    }
 
 
 @router.get("/{study_set_id}")
-async def get_study_set(study_set_id: str):
+async def get_study_set(oid: ObjectId = Depends(study_set_object_id)):
     """Get a study set by ID"""
     try:
-        doc = await study_sets_collection.find_one({"_id": ObjectId(study_set_id)})
+        doc = await study_sets_collection.find_one({"_id": oid})
         
         if not doc:
             raise HTTPException(
@@ -141,7 +139,24 @@ async def get_study_set(study_set_id: str):
 async def get_user_study_sets(user_id: str):
     """Get all study sets for a user"""
     try:
-        cursor = study_sets_collection.find({"ownerId": user_id}).sort("updatedAt", -1)
+        # Listing only needs summary fields; the nested items come from GET /{study_set_id}
+        cursor = study_sets_collection.aggregate([
+            {"$match": {"ownerId": user_id}},
+            {"$sort": {"updatedAt": -1}},
+            {"$project": {
+                "name": 1,
+                "description": 1,
+                "category": 1,
+                "language": 1,
+                "coverImagePath": 1,
+                "ownerId": 1,
+                "createdAt": 1,
+                "updatedAt": 1,
+                "quizCount": {"$size": {"$ifNull": ["$quizzes", []]}},
+                "flashcardSetCount": {"$size": {"$ifNull": ["$flashcardSets", []]}},
+                "noteCount": {"$size": {"$ifNull": ["$notes", []]}}
+            }}
+        ])
         docs = await cursor.to_list(length=None)
         
         study_sets = []
@@ -163,10 +178,18 @@ async def get_user_study_sets(user_id: str):
 
 
 @router.put("/{study_set_id}")
-async def update_study_set(study_set_id: str, study_set: StudySetCreate):
+async def update_study_set(study_set: StudySetCreate, oid: ObjectId = Depends(study_set_object_id)):
     """Update a study set"""
     try:
-        existing = await study_sets_collection.find_one({"_id": ObjectId(study_set_id)})
+        study_set_data = study_set.model_dump()
+        study_set_data['updatedAt'] = datetime.utcnow().isoformat()
+        
+        # Update in one round trip; the previous owner is returned for cache invalidation
+        existing = await study_sets_collection.find_one_and_update(
+            {"_id": oid},
+            {"$set": study_set_data},
+            projection={"ownerId": 1}
+        )
         
         if not existing:
             raise HTTPException(
@@ -174,13 +197,7 @@ async def update_study_set(study_set_id: str, study_set: StudySetCreate):
                 detail="Study set not found"
             )
         
-        study_set_data = study_set.dict()
-        study_set_data['updatedAt'] = datetime.utcnow().isoformat()
-        
-        await study_sets_collection.update_one(
-            {"_id": ObjectId(study_set_id)},
-            {"$set": study_set_data}
-        )
+        await library_cache.invalidate(existing.get("ownerId"), study_set_data["ownerId"])
         
         return {
             "success": True,
@@ -196,10 +213,13 @@ async def update_study_set(study_set_id: str, study_set: StudySetCreate):
 
 
 @router.delete("/{study_set_id}")
-async def delete_study_set(study_set_id: str):
+async def delete_study_set(oid: ObjectId = Depends(study_set_object_id)):
     """Delete a study set"""
     try:
-        existing = await study_sets_collection.find_one({"_id": ObjectId(study_set_id)})
+        existing = await study_sets_collection.find_one_and_delete(
+            {"_id": oid},
+            projection={"ownerId": 1}
+        )
         
         if not existing:
             raise HTTPException(
@@ -207,7 +227,7 @@ async def delete_study_set(study_set_id: str):
                 detail="Study set not found"
             )
         
-        await study_sets_collection.delete_one({"_id": ObjectId(study_set_id)})
+        await library_cache.invalidate(existing.get("ownerId"))
         
         return {
             "success": True,
@@ -223,34 +243,44 @@ async def delete_study_set(study_set_id: str):
 
 
 @router.get("/{study_set_id}/stats")
-async def get_study_set_stats(study_set_id: str):
+async def get_study_set_stats(oid: ObjectId = Depends(study_set_object_id)):
     """Get statistics for a study set"""
     try:
-        doc = await study_sets_collection.find_one({"_id": ObjectId(study_set_id)})
+        # Compute the counters server-side so only scalars come back, not the nested items
+        docs = await study_sets_collection.aggregate([
+            {"$match": {"_id": oid}},
+            {"$project": {
+                "_id": 0,
+                "totalQuizzes": {"$size": {"$ifNull": ["$quizzes", []]}},
+                "totalFlashcardSets": {"$size": {"$ifNull": ["$flashcardSets", []]}},
+                "totalNotes": {"$size": {"$ifNull": ["$notes", []]}},
+                "totalQuestions": {"$sum": {"$map": {
+                    "input": {"$ifNull": ["$quizzes", []]},
+                    "as": "q",
+                    "in": {"$size": {"$ifNull": ["$$q.questions", []]}}
+                }}},
+                "totalFlashcards": {"$sum": {"$map": {
+                    "input": {"$ifNull": ["$flashcardSets", []]},
+                    "as": "f",
+                    "in": {"$size": {"$ifNull": ["$$f.cards", []]}}
+                }}}
+            }}
+        ]).to_list(length=1)
         
-        if not doc:
+        if not docs:
             raise HTTPException(
                 status_code=status.HTTP_404_NOT_FOUND,
                 detail="Study set not found"
             )
         
+        counts = docs[0]
         stats = {
-            "totalQuizzes": len(doc.get('quizzes', [])),
-            "totalFlashcardSets": len(doc.get('flashcardSets', [])),
-            "totalNotes": len(doc.get('notes', [])),
-            "totalItems": (
-                len(doc.get('quizzes', [])) +
-                len(doc.get('flashcardSets', [])) +
-                len(doc.get('notes', []))
-            ),
-            "totalQuestions": sum(
-                len(quiz.get('questions', [])) 
-                for quiz in doc.get('quizzes', [])
-            ),
-            "totalFlashcards": sum(
-                len(fs.get('cards', [])) 
-                for fs in doc.get('flashcardSets', [])
-            )
+            "totalQuizzes": counts["totalQuizzes"],
+            "totalFlashcardSets": counts["totalFlashcardSets"],
+            "totalNotes": counts["totalNotes"],
+            "totalItems": counts["totalQuizzes"] + counts["totalFlashcardSets"] + counts["totalNotes"],
+            "totalQuestions": counts["totalQuestions"],
+            "totalFlashcards": counts["totalFlashcards"]
         }
         
         return {
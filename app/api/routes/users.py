@@ -3,6 +3,7 @@ from datetime import datetime
 from bson import ObjectId
 
 from app.core.database import users_collection, collection
+from app.utils.helpers import format_created_at
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -55,6 +56,8 @@ async def get_user(user_id: str):
                 "total_attempts": user.get("total_attempts", 0)
             }
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -76,6 +79,8 @@ async def update_user(user_id: str, user_data: dict):
             "message": "User profile updated successfully",
             "user_id": user_id
         }
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
@@ -97,7 +102,7 @@ async def get_user_quizzes(user_id: str):
                 "category": quiz.get("category", ""),
                 "language": quiz.get("language", ""),
                 "questionCount": len(quiz.get("questions", [])),
-                "createdAt": quiz.get("createdAt", "")
+                "createdAt": format_created_at(quiz.get("createdAt"))
             }
             for quiz in quizzes
         ]
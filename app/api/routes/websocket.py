@@ -1,27 +1,41 @@
-from datetime import datetime
+from types import MappingProxyType
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
-from app.services.connection_manager import manager
-from app.services.session_manager import SessionManager
-from app.services.game_controller import GameController
-from app.services.leaderboard_manager import LeaderboardManager
-import json
+from app.services.connection_manager import manager, EncodedMessage, JSON_FORMAT, MSGPACK_FORMAT, MESSAGE_FORMATS
+from app.services.session_manager import session_manager
+from app.services.game_controller import game_controller
+from app.services.leaderboard_manager import leaderboard_manager
+import orjson
+import ormsgpack
 import logging
 import asyncio
+import time
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
 
-session_manager = SessionManager()
-game_controller = GameController()
-leaderboard_manager = LeaderboardManager()
+
+def _error_message(message: str) -> EncodedMessage:
+    return EncodedMessage({"type": "error", "payload": {"message": message}})
+
+# Constant error replies, built once and encoded at most once per wire format
+ERR_SESSION_NOT_FOUND = _error_message("Session not found")
+ERR_SESSION_ACTIVE = _error_message("Session is already active")
+ERR_ONLY_HOST_START = _error_message("Only host can start the quiz")
+ERR_START_FAILED = _error_message("Failed to start session")
+ERR_NO_QUESTIONS = _error_message("No questions available")
+ERR_INVALID_ANSWER = _error_message("Invalid answer submission")
+ERR_ONLY_HOST_CONTROL = _error_message("Only host can control questions")
+ERR_ONLY_HOST_END = _error_message("Only host can end the quiz")
 
 # Store active timers for auto-advance
 active_timers = {}
 
 @router.websocket("/api/ws/{session_code}")
-async def websocket_endpoint(websocket: WebSocket, session_code: str, user_id: str = Query(...)):
+async def websocket_endpoint(websocket: WebSocket, session_code: str, user_id: str = Query(...), fmt: str = Query(JSON_FORMAT)):
     """
-    WebSocket endpoint for real-time quiz sessions
+    WebSocket endpoint for real-time quiz sessions.
+    Server messages are JSON text frames by default, or MessagePack binary frames with ?fmt=msgpack.
+    Client messages are JSON, in text or binary frames; with ?fmt=msgpack binary frames are MessagePack.
     """
     # === CRITICAL: Accept connection FIRST ===
     try:
@@ -34,47 +48,43 @@ async def websocket_endpoint(websocket: WebSocket, session_code: str, user_id: s
     # Check if user is host
     is_host = await session_manager.is_host(session_code, user_id)
     
+    # Unknown formats fall back to JSON so older clients keep working
+    if fmt not in MESSAGE_FORMATS:
+        fmt = JSON_FORMAT
+    
     # Register connection
-    await manager.connect(websocket, session_code, user_id, is_host)
+    await manager.connect(websocket, session_code, user_id, is_host, fmt)
     logger.info(f"Connection registered for user={user_id}, is_host={is_host}")
 
     try:
-        # Listen for messages
-        async for message_data in websocket.iter_text():
+        # Listen for messages straight off the ASGI receive channel; orjson parses str and bytes
+        # frames as they arrive, without iter_text()'s per-frame wrapper
+        decode_binary = ormsgpack.unpackb if fmt == MSGPACK_FORMAT else orjson.loads
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                logger.info(f"WebSocket disconnected for user={user_id}")
+                break
             try:
-                message = json.loads(message_data)
+                if frame.get("text") is not None:
+                    message = orjson.loads(frame["text"])
+                else:
+                    message = decode_binary(frame["bytes"])
                 message_type = message.get("type")
                 payload = message.get("payload", {})
                 
-                logger.info(f"📨 Received message type={message_type} from user={user_id}")
+                logger.debug("📨 Received message type=%s from user=%s", message_type, user_id)
 
-                if message_type == "join":
-                    await handle_join(websocket, session_code, user_id, payload)
-                
-                elif message_type == "start_quiz":
-                    await handle_start_quiz(websocket, session_code, user_id, payload)
-                
-                elif message_type == "submit_answer":
-                    logger.info(f"📝 Processing submit_answer from {user_id}")
-                    await handle_submit_answer(websocket, session_code, user_id, payload)
-                
-                elif message_type == "next_question":
-                    await handle_next_question(websocket, session_code, user_id)
-                
-                elif message_type == "request_next_question":
-                    await handle_request_next_question(websocket, session_code, user_id)
-                
-                elif message_type == "end_quiz":
-                    await handle_end_quiz(websocket, session_code, user_id)
-                
-                elif message_type == "request_leaderboard":
-                    await handle_request_leaderboard(websocket, session_code, user_id)
-                
+                handler = HANDLERS.get(message_type)
+                if handler:
+                    await handler(websocket, session_code, user_id, payload)
                 else:
                     logger.warning(f"Unknown message type: {message_type}")
 
-            except json.JSONDecodeError as e:
+            except orjson.JSONDecodeError as e:
                 logger.error(f"Invalid JSON: {e}")
+            except ormsgpack.MsgpackDecodeError as e:
+                logger.error(f"Invalid MessagePack: {e}")
             except Exception as e:
                 logger.error(f"Error processing message: {e}")
 
@@ -90,35 +100,33 @@ async def websocket_endpoint(websocket: WebSocket, session_code: str, user_id: s
 async def handle_join(websocket: WebSocket, session_code: str, user_id: str, payload: dict):
     username = payload.get("username", "Anonymous")
     
-    logger.info(f"📨 JOIN request - session={session_code}, user={user_id}, username={username}")
+    logger.debug("📨 JOIN request - session=%s, user=%s, username=%s", session_code, user_id, username)
     
     # Validate session
     session = await session_manager.get_session(session_code)
     if not session:
         logger.error(f"❌ Session {session_code} not found!")
-        await manager.send_personal_message({"type": "error", "payload": {"message": "Session not found"}}, websocket)
+        await manager.send_encoded_message(ERR_SESSION_NOT_FOUND, websocket)
         return
     
-    logger.info(f"✅ Session {session_code} found. Current status: {session.get('status')}")
+    logger.debug("✅ Session %s found. Current status: %s", session_code, session.get("status"))
     
-    # ✅ CHECK IF USER IS HOST FIRST
-    is_host = await session_manager.is_host(session_code, user_id)
+    # ✅ CHECK IF USER IS HOST FIRST (host_id is already in the session we just loaded)
+    is_host = session.get("host_id") == user_id
     
     if is_host:
         # Host is joining - send session state without adding to participants
-        logger.info(f"✅ HOST {user_id} ({username}) joining their own session {session_code}")
+        logger.debug("✅ HOST %s (%s) joining their own session %s", user_id, username, session_code)
         
-        # Prepare session payload with participants as list
-        session_payload = {**session}
+        # Prepare session payload with participants as list (+ participant_count for Flutter)
         participants_list = list(session.get("participants", {}).values())
-        session_payload["participants"] = participants_list
+        participant_count = len(participants_list)
+        session_payload = {**session, "participants": participants_list, "participant_count": participant_count}
         
-        # ✅ ADD participant_count for Flutter
-        session_payload["participant_count"] = len(participants_list)
-        
-        logger.info(f"📊 HOST - Current participants: {len(participants_list)}")
-        for p in participants_list:
-            logger.info(f"   - {p.get('username', 'Unknown')} (ID: {p.get('user_id', 'Unknown')})")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("📊 HOST - Current participants: %d", participant_count)
+            for p in participants_list:
+                logger.debug("   - %s (ID: %s)", p.get("username", "Unknown"), p.get("user_id", "Unknown"))
         
         # Send session state to host
         await manager.send_personal_message({
@@ -126,73 +134,66 @@ async def handle_join(websocket: WebSocket, session_code: str, user_id: str, pay
             "payload": session_payload
         }, websocket)
         
-        logger.info(f"✅ Sent session_state to HOST {user_id}")
+        logger.info("✅ Sent session_state to HOST %s in session %s (%d participants)", user_id, session_code, participant_count)
         return  # Done - host doesn't get added to participants
     
     # ✅ REGULAR PARTICIPANT LOGIC BELOW
-    logger.info(f"👤 PARTICIPANT {user_id} ({username}) joining session {session_code}")
+    logger.debug("👤 PARTICIPANT %s (%s) joining session %s", user_id, username, session_code)
     participants = session.get("participants", {})
     is_reconnecting = user_id in participants
     
-    if is_reconnecting:
-        logger.info(f"🔄 User {user_id} is RECONNECTING")
-    else:
-        logger.info(f"🆕 User {user_id} is a NEW participant")
+    logger.debug("%s User %s is %s", "🔄" if is_reconnecting else "🆕", user_id, "RECONNECTING" if is_reconnecting else "a NEW participant")
     
     # Check if session is still accepting new participants
     if session["status"] != "waiting" and not is_reconnecting:
         logger.warning(f"❌ Session {session_code} is {session['status']}, cannot accept new participants")
-        await manager.send_personal_message({"type": "error", "payload": {"message": "Session is already active"}}, websocket)
+        await manager.send_encoded_message(ERR_SESSION_ACTIVE, websocket)
         return
     
-    # Add or reconnect participant
-    success = await session_manager.add_participant(session_code, user_id, username)
+    # Add or reconnect participant - returns the updated participants, so the session needn't be re-read
+    participants = await session_manager.add_participant(session_code, user_id, username)
     
-    if success:
-        logger.info(f"✅ Successfully added {username} (ID: {user_id}) to session {session_code}")
+    if participants is not None:
+        logger.info("✅ Successfully added %s (ID: %s) to session %s", username, user_id, session_code)
         
         # Broadcast update to all
-        session = await session_manager.get_session(session_code)
-        participants_list = list(session["participants"].values())
+        participants_list = list(participants.values())
+        participant_count = len(participants_list)
         
-        logger.info(f"📡 Broadcasting session_update to all connections in {session_code}")
-        logger.info(f"📊 Total participants after join: {len(participants_list)}")
+        logger.debug("📡 Broadcasting session_update to all connections in %s", session_code)
+        logger.debug("📊 Total participants after join: %d", participant_count)
         
         await manager.broadcast_to_session({
             "type": "session_update",
             "payload": {
                 "status": session["status"],
-                "participant_count": len(participants_list),
+                "participant_count": participant_count,
                 "participants": participants_list
             }
         }, session_code)
         
-        logger.info(f"✅ Broadcast complete for session {session_code}")
+        logger.debug("✅ Broadcast complete for session %s", session_code)
         
-        # Send current state to this participant
-        session_payload = {**session}
-        session_payload["participants"] = participants_list
-        
-        # ✅ ADD participant_count for Flutter
-        session_payload["participant_count"] = len(participants_list)
+        # Send current state to this participant (+ participant_count for Flutter)
+        session_payload = {**session, "participants": participants_list, "participant_count": participant_count}
         
         await manager.send_personal_message({
             "type": "session_state",
             "payload": session_payload
         }, websocket)
         
-        logger.info(f"✅ Sent session_state to participant {user_id}")
+        logger.debug("✅ Sent session_state to participant %s", user_id)
         
         # If reconnecting during active quiz, send current question
         if is_reconnecting and session["status"] == "active":
-            logger.info(f"🎮 Sending current question to reconnecting user {user_id}")
+            logger.debug("🎮 Sending current question to reconnecting user %s", user_id)
             question_data = await game_controller.get_current_question(session_code)
             if question_data:
                 await manager.send_personal_message({
                     "type": "question",
                     "payload": question_data
                 }, websocket)
-                logger.info(f"✅ Sent current question to {user_id}")
+                logger.debug("✅ Sent current question to %s", user_id)
     else:
         logger.error(f"❌ Failed to add {username} (ID: {user_id}) to session {session_code}")
 
@@ -241,6 +242,7 @@ async def auto_advance_question(session_code: str, time_limit: int, question_ind
             
             # Get final results
             final_results = await leaderboard_manager.get_final_results(session_code)
+            leaderboard_manager.forget(session_code)
             
             # Broadcast quiz end
             await manager.broadcast_to_session({
@@ -256,13 +258,9 @@ async def auto_advance_question(session_code: str, time_limit: int, question_ind
 
 async def handle_start_quiz(websocket: WebSocket, session_code: str, user_id: str, payload: dict = None):
     """Host starts the quiz"""
-    is_host = await session_manager.is_host(session_code, user_id)
-    
-    if not is_host:
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Only host can start the quiz"}
-        }, websocket)
+    # Host identity was resolved once when the connection was registered
+    if not manager.is_host(session_code, user_id):
+        await manager.send_encoded_message(ERR_ONLY_HOST_START, websocket)
         return
     
     # Extract time settings from payload
@@ -275,21 +273,15 @@ async def handle_start_quiz(websocket: WebSocket, session_code: str, user_id: st
         logger.info(f"⏱️ Updated time settings: per_question={per_question_time_limit}s")
     
     # Start the quiz - update session status
-    success = await session_manager.start_session(session_code, user_id)
-    if not success:
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Failed to start session"}
-        }, websocket)
+    result = await session_manager.start_session(session_code, user_id)
+    if result != "started":
+        await manager.send_encoded_message(ERR_START_FAILED, websocket)
         return
     
-    # Initialize all participants to question 0
-    session = await session_manager.get_session(session_code)
-    participants = session.get("participants", {})
+    # Initialize all participants to question 0 (only the fields used below are read back)
+    participant_ids, per_question_time_limit = await session_manager.get_start_state(session_code)
     
-    for participant_id in participants.keys():
-        await game_controller.set_participant_question_index(session_code, participant_id, 0)
-        logger.info(f"📝 Initialized participant {participant_id} to question 0")
+    await game_controller.set_participant_question_indices(session_code, participant_ids, 0)
     
     # Start the question timer
     await game_controller.start_question_timer(session_code)
@@ -298,15 +290,9 @@ async def handle_start_quiz(websocket: WebSocket, session_code: str, user_id: st
     question_data = await game_controller.get_question_by_index(session_code, 0)
     
     if not question_data:
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "No questions available"}
-        }, websocket)
+        await manager.send_encoded_message(ERR_NO_QUESTIONS, websocket)
         return
     
-    # Get time settings for the quiz_started payload
-    per_question_time_limit = int(session.get("per_question_time_limit", 30))
-    
     # Broadcast quiz started to all participants with time settings
     await manager.broadcast_to_session({
         "type": "quiz_started",
@@ -333,22 +319,21 @@ async def handle_start_quiz(websocket: WebSocket, session_code: str, user_id: st
 async def handle_submit_answer(websocket: WebSocket, session_code: str, user_id: str, payload: dict):
     """Participant submits an answer"""
     answer = payload.get("answer")
-    timestamp = payload.get("timestamp", datetime.utcnow().timestamp())
+    timestamp = payload.get("timestamp")
+    if timestamp is None:
+        timestamp = time.time()
     is_timeout = payload.get("timeout", False)
     
     # Allow null answers for timeouts
     if answer is None and not is_timeout:
         logger.error(f"❌ ANSWER - No answer provided in payload: {payload}")
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Invalid answer submission"}
-        }, websocket)
+        await manager.send_encoded_message(ERR_INVALID_ANSWER, websocket)
         return
     
     if is_timeout:
-        logger.info(f"⏰ ANSWER - User {user_id} timed out (no answer submitted)")
+        logger.debug("⏰ ANSWER - User %s timed out (no answer submitted)", user_id)
     else:
-        logger.info(f"📝 ANSWER - User {user_id} submitted answer: {answer} (timestamp: {timestamp})")
+        logger.debug("📝 ANSWER - User %s submitted answer: %s (timestamp: %s)", user_id, answer, timestamp)
     
     # Process answer
     result = await game_controller.submit_answer(
@@ -357,36 +342,26 @@ async def handle_submit_answer(websocket: WebSocket, session_code: str, user_id:
     
     is_correct = result.get('is_correct', False)
     points = result.get('points', 0)
-    logger.info(f"{'✅' if is_correct else '❌'} ANSWER - Result for {user_id}: {'CORRECT' if is_correct else 'INCORRECT'}, Points: {points}")
+    logger.debug("%s ANSWER - Result for %s: %s, Points: %s", "✅" if is_correct else "❌", user_id, "CORRECT" if is_correct else "INCORRECT", points)
     
     # Send result to participant
     await manager.send_personal_message({
         "type": "answer_result",
         "payload": result
     }, websocket)
-    logger.info(f"📤 ANSWER - Sent answer result to {user_id}")
+    logger.debug("📤 ANSWER - Sent answer result to %s", user_id)
     
-    # ✅ GET AND BROADCAST REAL-TIME LEADERBOARD
-    leaderboard = await leaderboard_manager.get_leaderboard(session_code)
-    logger.info(f"🏆 LEADERBOARD - Broadcasting update to session {session_code} ({len(leaderboard)} participants)")
-    
-    await manager.broadcast_to_session({
-        "type": "leaderboard_update",
-        "payload": {"leaderboard": leaderboard}
-    }, session_code)
+    # ✅ BROADCAST REAL-TIME LEADERBOARD (answers arriving together share one broadcast)
+    leaderboard_manager.schedule_broadcast(session_code)
     
-    logger.info(f"✅ LEADERBOARD - Broadcast complete for session {session_code}")
+    logger.info("✅ ANSWER - %s in session %s: %s, %s points, leaderboard scheduled", user_id, session_code, "CORRECT" if is_correct else "INCORRECT", points)
 
 
-async def handle_next_question(websocket: WebSocket, session_code: str, user_id: str):
+async def handle_next_question(websocket: WebSocket, session_code: str, user_id: str, payload: dict = None):
     """Host moves to next question (broadcast to all)"""
-    is_host = await session_manager.is_host(session_code, user_id)
-    
-    if not is_host:
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Only host can control questions"}
-        }, websocket)
+    # Host identity was resolved once when the connection was registered
+    if not manager.is_host(session_code, user_id):
+        await manager.send_encoded_message(ERR_ONLY_HOST_CONTROL, websocket)
         return
     
     # Cancel existing timer for current question
@@ -422,20 +397,19 @@ async def handle_next_question(websocket: WebSocket, session_code: str, user_id:
         await handle_end_quiz(websocket, session_code, user_id)
 
 
-async def handle_request_next_question(websocket: WebSocket, session_code: str, user_id: str):
+async def handle_request_next_question(websocket: WebSocket, session_code: str, user_id: str, payload: dict = None):
     """Participant requests their next question (self-paced)"""
-    logger.info(f"📨 SELF_PACED - Participant {user_id} requesting next question")
+    logger.debug("📨 SELF_PACED - Participant %s requesting next question", user_id)
     
     # Get participant's current progress
     participant_question_index = await game_controller.get_participant_question_index(session_code, user_id)
     total_questions = await game_controller.get_total_questions(session_code)
     
-    logger.info(f"📊 SELF_PACED - Current index for {user_id}: {participant_question_index}/{total_questions}")
-    logger.info(f"🔍 SELF_PACED - Checking completion: {participant_question_index} >= {total_questions - 1} = {participant_question_index >= total_questions - 1}")
+    logger.debug("📊 SELF_PACED - Current index for %s: %s/%s", user_id, participant_question_index, total_questions)
     
     # Check if participant has already completed all questions
     if participant_question_index >= total_questions - 1:
-        logger.info(f"🏁 SELF_PACED - ✅ COMPLETION TRIGGERED! Participant {user_id} has completed all questions!")
+        logger.info("🏁 SELF_PACED - Participant %s has completed all questions", user_id)
         
         # Get final results
         final_results = await leaderboard_manager.get_final_results(session_code)
@@ -448,15 +422,12 @@ async def handle_request_next_question(websocket: WebSocket, session_code: str,
                 "results": final_results
             }
         }, websocket)
-        logger.info(f"✅ SELF_PACED - Sent completion message to {user_id}")
+        logger.debug("✅ SELF_PACED - Sent completion message to %s", user_id)
         
         # Broadcast updated leaderboard to everyone (including host)
-        leaderboard = await leaderboard_manager.get_leaderboard(session_code)
-        await manager.broadcast_to_session({
-            "type": "leaderboard_update",
-            "payload": {"leaderboard": leaderboard}
-        }, session_code)
-        logger.info(f"📢 SELF_PACED - Broadcasted leaderboard update after {user_id} completed")
+        leaderboard_update = await leaderboard_manager.get_leaderboard_update(session_code)
+        await manager.broadcast_encoded_to_session(leaderboard_update, session_code)
+        logger.debug("📢 SELF_PACED - Broadcasted leaderboard update after %s completed", user_id)
         
         return
     
@@ -464,22 +435,22 @@ async def handle_request_next_question(websocket: WebSocket, session_code: str,
     next_index = participant_question_index + 1
     await game_controller.set_participant_question_index(session_code, user_id, next_index)
     
-    logger.info(f"➡️ SELF_PACED - Participant {user_id} advancing: Q{participant_question_index} → Q{next_index}")
+    logger.debug("➡️ SELF_PACED - Participant %s advancing: Q%s → Q%s", user_id, participant_question_index, next_index)
     
     # Get the next question for this participant
     question_data = await game_controller.get_question_by_index(session_code, next_index)
     
     if question_data:
         # Send next question to this participant only
-        logger.info(f"📤 SELF_PACED - Sending Q{next_index + 1}/{total_questions} to participant {user_id}")
+        logger.debug("📤 SELF_PACED - Sending Q%d/%s to participant %s", next_index + 1, total_questions, user_id)
         await manager.send_personal_message({
             "type": "question",
             "payload": question_data
         }, websocket)
-        logger.info(f"✅ SELF_PACED - Successfully sent Q{next_index + 1} to {user_id}")
+        logger.info("✅ SELF_PACED - Sent Q%d/%s to %s", next_index + 1, total_questions, user_id)
     else:
         # No more questions - participant finished
-        logger.info(f"🏁 SELF_PACED - Participant {user_id} completed all questions!")
+        logger.info("🏁 SELF_PACED - Participant %s completed all questions", user_id)
         
         # Get final results
         final_results = await leaderboard_manager.get_final_results(session_code)
@@ -492,26 +463,19 @@ async def handle_request_next_question(websocket: WebSocket, session_code: str,
                 "results": final_results
             }
         }, websocket)
-        logger.info(f"✅ SELF_PACED - Sent completion message to {user_id}")
+        logger.debug("✅ SELF_PACED - Sent completion message to %s", user_id)
         
         # Broadcast updated leaderboard to everyone (including host)
-        leaderboard = await leaderboard_manager.get_leaderboard(session_code)
-        await manager.broadcast_to_session({
-            "type": "leaderboard_update",
-            "payload": {"leaderboard": leaderboard}
-        }, session_code)
-        logger.info(f"📢 SELF_PACED - Broadcasted leaderboard update after {user_id} completed")
+        leaderboard_update = await leaderboard_manager.get_leaderboard_update(session_code)
+        await manager.broadcast_encoded_to_session(leaderboard_update, session_code)
+        logger.debug("📢 SELF_PACED - Broadcasted leaderboard update after %s completed", user_id)
 
 
-async def handle_end_quiz(websocket: WebSocket, session_code: str, user_id: str):
+async def handle_end_quiz(websocket: WebSocket, session_code: str, user_id: str, payload: dict = None):
     """Host ends the quiz or quiz completes naturally"""
-    is_host = await session_manager.is_host(session_code, user_id)
-    
-    if not is_host:
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Only host can end the quiz"}
-        }, websocket)
+    # Host identity was resolved once when the connection was registered
+    if not manager.is_host(session_code, user_id):
+        await manager.send_encoded_message(ERR_ONLY_HOST_END, websocket)
         return
     
     # Mark session as completed
@@ -519,6 +483,7 @@ async def handle_end_quiz(websocket: WebSocket, session_code: str, user_id: str)
     
     # Get final results
     final_results = await leaderboard_manager.get_final_results(session_code)
+    leaderboard_manager.forget(session_code)
     
     # Broadcast quiz end
     await manager.broadcast_to_session({
@@ -530,45 +495,38 @@ async def handle_end_quiz(websocket: WebSocket, session_code: str, user_id: str)
     }, session_code)
 
 
-async def handle_request_leaderboard(websocket: WebSocket, session_code: str, user_id: str):
+async def handle_request_leaderboard(websocket: WebSocket, session_code: str, user_id: str, payload: dict = None):
     """Participant requests real-time leaderboard with question progress"""
     logger.info(f"🏆 LEADERBOARD_REQUEST - User {user_id} requesting leaderboard for session {session_code}")
     
-    # Get session data with participants
+    # Validate session
     session = await session_manager.get_session(session_code)
     if not session:
         logger.error(f"❌ Session {session_code} not found")
-        await manager.send_personal_message({
-            "type": "error",
-            "payload": {"message": "Session not found"}
-        }, websocket)
+        await manager.send_encoded_message(ERR_SESSION_NOT_FOUND, websocket)
         return
     
-    participants = session.get("participants", {})
     total_questions = session.get("total_questions", 0)
     
-    # Build leaderboard with question progress
-    leaderboard_entries = []
-    for participant_id, participant_data in participants.items():
-        # Get participant's current question index
-        question_index = await game_controller.get_participant_question_index(session_code, participant_id)
-        
-        # Count answered questions from their answers array
-        answers = participant_data.get("answers", [])
-        answered_count = len(answers)
-        
-        leaderboard_entries.append({
-            "user_id": participant_id,
-            "username": participant_data.get("username", "Unknown"),
-            "score": participant_data.get("score", 0),
+    # Ranked like the broadcast leaderboard; add each participant's question progress,
+    # fetching every participant's index in one round trip
+    leaderboard = await leaderboard_manager.get_leaderboard(session_code)
+    question_indices = await game_controller.get_participant_question_indices(
+        session_code, [entry["user_id"] for entry in leaderboard]
+    )
+    
+    leaderboard_entries = [
+        {
+            "user_id": entry["user_id"],
+            "username": entry["username"],
+            "score": entry["score"],
             "question_index": question_index,
-            "answered_count": answered_count,
+            "answered_count": entry["answered_count"],
             "total_questions": total_questions,
-            "connected": participant_data.get("connected", False)
-        })
-    
-    # Sort by score (descending)
-    leaderboard_entries.sort(key=lambda x: x["score"], reverse=True)
+            "connected": entry["is_connected"]
+        }
+        for entry, question_index in zip(leaderboard, question_indices)
+    ]
     
     logger.info(f"📊 LEADERBOARD_REQUEST - Sending {len(leaderboard_entries)} entries to {user_id}")
     for i, entry in enumerate(leaderboard_entries[:5]):
@@ -584,3 +542,15 @@ async def handle_request_leaderboard(websocket: WebSocket, session_code: str, us
     }, websocket)
     
     logger.info(f"✅ LEADERBOARD_REQUEST - Sent leaderboard to {user_id}")
+
+
+# Message type -> handler; every handler takes (websocket, session_code, user_id, payload)
+HANDLERS = MappingProxyType({
+    "join": handle_join,
+    "start_quiz": handle_start_quiz,
+    "submit_answer": handle_submit_answer,
+    "next_question": handle_next_question,
+    "request_next_question": handle_request_next_question,
+    "end_quiz": handle_end_quiz,
+    "request_leaderboard": handle_request_leaderboard,
+})
@@ -7,10 +7,14 @@ load_dotenv()
 # MongoDB configuration
 MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
 MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "quiz_app")
+MONGODB_MAX_POOL_SIZE = int(os.getenv("MONGODB_MAX_POOL_SIZE", "50"))
+MONGODB_MIN_POOL_SIZE = int(os.getenv("MONGODB_MIN_POOL_SIZE", "5"))
 
 # Redis configuration
 REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379")
 REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "50"))
+# Optional read replica for read-only leaderboard traffic; unset means reads go to REDIS_URL
+REDIS_REPLICA_URL = os.getenv("REDIS_REPLICA_URL")
 
 # WebSocket configuration
 WEBSOCKET_PING_INTERVAL = int(os.getenv("WEBSOCKET_PING_INTERVAL", "30"))
@@ -22,10 +26,23 @@ QUESTION_TIME_SECONDS = int(os.getenv("QUESTION_TIME_SECONDS", "30"))
 SESSION_EXPIRY_HOURS = int(os.getenv("SESSION_EXPIRY_HOURS", "24"))
 MAX_PARTICIPANTS_PER_SESSION = int(os.getenv("MAX_PARTICIPANTS_PER_SESSION", "50"))
 
+# Cache configuration
+LIBRARY_CACHE_TTL_SECONDS = int(os.getenv("LIBRARY_CACHE_TTL_SECONDS", "60"))
+
+# Default cover images, keyed by lowercased category
+COVER_IMAGES = {
+    "language learning": "https://img.freepik.com/free-vector/notes-concept-illustration_114360-839.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740",
+    "science and technology": "https://img.freepik.com/free-vector/coding-concept-illustration_114360-1155.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740",
+    "law": "http://img.freepik.com/free-vector/law-firm-concept-illustration_114360-8626.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740",
+}
+DEFAULT_COVER = "https://img.freepik.com/free-vector/student-asking-teacher-concept-illustration_114360-19831.jpg?ga=GA1.1.377073698.1750732876&semt=ais_items_boosted&w=740"
+
 # App configuration
 APP_TITLE = "Quiz App API"
 APP_VERSION = "1.0"
 APP_DESCRIPTION = "FastAPI Quiz Application Backend"
+# e.g. WARNING in production, DEBUG to see per-message WebSocket logs
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
 
 # CORS origins
 # Note: When allow_credentials=True, you cannot use wildcard "*" for origins
@@ -1,10 +1,24 @@
+import logging
+
 from motor.motor_asyncio import AsyncIOMotorClient
-from app.core.config import MONGODB_URL, MONGODB_DB_NAME
+from pymongo.errors import OperationFailure
+from app.core.config import MONGODB_URL, MONGODB_DB_NAME, MONGODB_MAX_POOL_SIZE, MONGODB_MIN_POOL_SIZE
 
 # MongoDB client and database
-client = AsyncIOMotorClient(MONGODB_URL)
+# A bounded pool with a few connections kept warm, so bursts don't wait on TLS handshakes;
+# replies are compressed on the wire (zstd when available, zlib otherwise)
+client = AsyncIOMotorClient(
+    MONGODB_URL,
+    maxPoolSize=MONGODB_MAX_POOL_SIZE,
+    minPoolSize=MONGODB_MIN_POOL_SIZE,
+    maxIdleTimeMS=60000,
+    serverSelectionTimeoutMS=5000,
+    compressors="zstd,zlib"
+)
 db = client[MONGODB_DB_NAME]
 
+logger = logging.getLogger(__name__)
+
 # Collections
 collection = db.quizzes
 sessions_collection = db.quiz_sessions
@@ -19,14 +33,85 @@ tags_collection = db.tags
 live_sessions_collection = db.live_multiplayer_sessions
 live_game_results_collection = db.live_game_results
 
+
+async def warm_up():
+    """Open the first MongoDB connection before any request needs it"""
+    await client.admin.command("ping")
+
+
+# Indexes as (collection, keys, options). The unique ones that queries rely on for
+# correctness come first, and each is created on its own, so one failing (e.g. an
+# options conflict or existing duplicates) doesn't stop the rest from being built
+INDEXES = [
+    # A user can only hold one copy of a given shared quiz / flashcard set
+    *(
+        (shared_copies, [("creatorId", 1), ("originalSourceId", 1)], {
+            "unique": True,
+            "partialFilterExpression": {"originalSourceId": {"$exists": True}}
+        })
+        for shared_copies in (collection, db.flashcard_sets)
+    ),
+    # Session codes are looked up on every join / add-to-library and must not repeat
+    (sessions_collection, "session_code", {"unique": True}),
+    # Library listings filter by owner and sort by createdAt (most recent first)
+    (collection, [("creatorId", 1), ("createdAt", -1)], {}),
+    (db.flashcard_sets, [("creatorId", 1), ("createdAt", -1)], {}),
+    (db.notes, [("creatorId", 1), ("createdAt", -1)], {}),
+    (db.study_sets, [("ownerId", 1), ("createdAt", -1)], {}),
+    # Paginated library listings sort by _id and page with an _id cursor
+    (collection, [("creatorId", 1), ("_id", -1)], {}),
+    (db.flashcard_sets, [("creatorId", 1), ("_id", -1)], {}),
+    (db.notes, [("creatorId", 1), ("_id", -1)], {}),
+    (db.study_sets, [("ownerId", 1), ("_id", -1)], {}),
+    # The study set listing filters by owner and sorts by updatedAt
+    (db.study_sets, [("ownerId", 1), ("updatedAt", -1)], {}),
+    # Category/language filters and literal searches match on lowercased copies of the fields
+    (collection, "category_lc", {}),
+    (collection, "language_lc", {}),
+    (collection, "title_lc", {}),
+    (collection, "description_lc", {}),
+    # Quiz search matches words in the title (weighted higher) and description
+    (collection, [("title", "text"), ("description", "text")], {
+        "weights": {"title": 10, "description": 5},
+        "name": "quiz_text"
+    }),
+]
+
+
+async def ensure_indexes():
+    """Create the indexes in INDEXES (no-op for those that already exist).
+    An index the server rejects is logged and skipped; connection errors propagate."""
+    for target, keys, options in INDEXES:
+        try:
+            await target.create_index(keys, **options)
+        except OperationFailure as e:
+            logger.error(f"Failed to create index {keys} on {target.name}: {e}")
+
 # Redis client
 import redis.asyncio as redis
-from app.core.config import REDIS_URL
+from app.core.config import REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_REPLICA_URL
 import ssl
 
-# Configure SSL for Upstash (rediss:// URLs)
-redis_client = redis.from_url(
-    REDIS_URL, 
-    decode_responses=True,
-    ssl_cert_reqs=ssl.CERT_NONE if REDIS_URL.startswith("rediss://") else None
+def _redis_pool(url: str) -> redis.BlockingConnectionPool:
+    # Configure SSL for Upstash (rediss:// URLs)
+    # One process-wide pool; callers wait for a free connection instead of failing when it is exhausted.
+    # Replies are parsed by hiredis's C parser, which redis-py picks automatically when it is installed.
+    # Keepalive plus periodic health checks keep idle TLS connections from being silently dropped.
+    return redis.BlockingConnectionPool.from_url(
+        url, 
+        max_connections=REDIS_MAX_CONNECTIONS,
+        decode_responses=True,
+        socket_keepalive=True,
+        socket_timeout=5,
+        health_check_interval=30,
+        ssl_cert_reqs=ssl.CERT_NONE if url.startswith("rediss://") else None
+    )
+
+redis_pool = _redis_pool(REDIS_URL)
+redis_client = redis.Redis(connection_pool=redis_pool)
+
+# Read-only traffic that tolerates replication lag (live leaderboards) can go to a replica,
+# leaving the primary to the answer writes; without one it shares the primary client
+redis_replica_client = (
+    redis.Redis(connection_pool=_redis_pool(REDIS_REPLICA_URL)) if REDIS_REPLICA_URL else redis_client
 )
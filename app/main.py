@@ -1,4 +1,6 @@
-from fastapi import FastAPI
+import logging
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.core.config import (
@@ -10,6 +12,8 @@ from app.core.config import (
     CORS_METHODS,
     CORS_HEADERS
 )
+from app.core.database import ensure_indexes, warm_up
+from app.core.responses import ORJSONResponse
 from app.api.routes import (
     quizzes,
     flashcards,
@@ -28,10 +32,13 @@ from app.api.routes import (
     ai_generation
 )
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title=APP_TITLE,
     version=APP_VERSION,
-    description=APP_DESCRIPTION
+    description=APP_DESCRIPTION,
+    default_response_class=ORJSONResponse
 )
 
 # CORS setup
@@ -43,6 +50,12 @@ app.add_middleware(
     allow_headers=CORS_HEADERS,
 )
 
+# Unhandled errors become a 500 with the error message, as the per-route wrappers used to do
+@app.exception_handler(Exception)
+async def unhandled_exception_handler(request: Request, exc: Exception):
+    logger.error(f"Unhandled error on {request.method} {request.url.path}: {exc}")
+    return ORJSONResponse(status_code=500, content={"detail": str(exc)})
+
 # Include routers
 app.include_router(quizzes.router)
 app.include_router(flashcards.router)
@@ -60,6 +73,23 @@ app.include_router(categories.router)
 app.include_router(live_multiplayer.router)
 app.include_router(websocket.router)
 
+@app.on_event("startup")
+async def warm_up_mongodb():
+    """Connect to MongoDB up front so the first requests don't pay for it"""
+    try:
+        await warm_up()
+    except Exception as e:
+        logger.error(f"Failed to connect to MongoDB on startup: {e}")
+
+@app.on_event("startup")
+async def create_indexes():
+    """Make sure the MongoDB indexes used by the API exist"""
+    try:
+        await ensure_indexes()
+    except Exception as e:
+        # Don't block startup if MongoDB is unreachable; queries still work without indexes
+        logger.error(f"Failed to create MongoDB indexes: {e}")
+
 @app.get("/")
 async def root():
     return {
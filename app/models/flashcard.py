@@ -36,3 +36,4 @@ class FlashcardLibraryResponse(BaseModel):
     success: bool
     data: List[FlashcardLibraryItem]
     count: int
+    next_cursor: Optional[str] = None  # Pass as ?cursor= to fetch the next page
@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from typing import List, Optional, Dict
 
 class Question(BaseModel):
@@ -27,6 +27,18 @@ class Quiz(BaseModel):
     createdAt: Optional[str] = None  # string instead of datetime
 
 
+class QuizCreate(Quiz):
+    """Quiz body accepted on create/replace; stored quizzes are read back as the lenient Quiz"""
+    questions: List[Question] = Field(min_length=1)
+
+    @field_validator("title", "description", "language", "category", "creatorId")
+    @classmethod
+    def _non_empty(cls, v: str) -> str:
+        if not v.strip():
+            raise ValueError("cannot be empty")
+        return v
+
+
 class QuizResponse(BaseModel):
     id: str
     message: str
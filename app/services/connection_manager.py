@@ -1,55 +1,93 @@
-from typing import Dict, List, Any
 from fastapi import WebSocket
-import json
+import asyncio
+import orjson
+import ormsgpack
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Wire formats a client can pick with ?fmt= on connect
+JSON_FORMAT = "json"
+MSGPACK_FORMAT = "msgpack"
+MESSAGE_FORMATS = (JSON_FORMAT, MSGPACK_FORMAT)
+
+Frame = str | bytes
+
+def encode_message(message: dict, fmt: str = JSON_FORMAT) -> Frame:
+    """
+    Serialize a message for the given wire format: JSON text (orjson, sent as a
+    text frame like send_json would) or MessagePack bytes (sent as a binary frame)
+    """
+    if fmt == MSGPACK_FORMAT:
+        return ormsgpack.packb(message, option=ormsgpack.OPT_NON_STR_KEYS)
+    return orjson.dumps(message, option=orjson.OPT_NON_STR_KEYS).decode()
+
+
+class EncodedMessage:
+    """A message encoded at most once per wire format, however many connections it goes to"""
+    __slots__ = ("message", "_frames")
+
+    def __init__(self, message: dict):
+        self.message = message
+        self._frames: dict[str, Frame] = {}
+
+    def frame(self, fmt: str) -> Frame:
+        frame = self._frames.get(fmt)
+        if frame is None:
+            frame = self._frames[fmt] = encode_message(self.message, fmt)
+        return frame
+
+
 class ConnectionManager:
+    __slots__ = ("active_connections", "user_connections", "connection_roles", "connection_formats")
+
     def __init__(self):
-        # Map session_code -> list of WebSockets
-        self.active_connections: Dict[str, List[WebSocket]] = {}
+        # Map session_code -> set of WebSockets
+        self.active_connections: dict[str, set[WebSocket]] = {}
         # Map user_id -> WebSocket (for direct messaging)
-        self.user_connections: Dict[str, WebSocket] = {}
+        self.user_connections: dict[str, WebSocket] = {}
         # Map session_code -> {user_id -> isHost}
-        self.connection_roles: Dict[str, Dict[str, bool]] = {}
+        self.connection_roles: dict[str, dict[str, bool]] = {}
+        # Map WebSocket -> wire format it asked for (JSON_FORMAT when absent)
+        self.connection_formats: dict[WebSocket, str] = {}
 
-    async def connect(self, websocket: WebSocket, session_code: str, user_id: str, is_host: bool = False):
+    async def connect(self, websocket: WebSocket, session_code: str, user_id: str, is_host: bool = False, fmt: str = JSON_FORMAT):
         # ✅ DO NOT accept here - already accepted in endpoint
         # Connection is already established when this method is called
         
-        if session_code not in self.active_connections:
-            self.active_connections[session_code] = []
-        
-        if session_code not in self.connection_roles:
-            self.connection_roles[session_code] = {}
-        
-        self.active_connections[session_code].append(websocket)
+        self.active_connections.setdefault(session_code, set()).add(websocket)
         self.user_connections[user_id] = websocket
-        self.connection_roles[session_code][user_id] = is_host
+        self.connection_roles.setdefault(session_code, {})[user_id] = is_host
+        if fmt != JSON_FORMAT:
+            self.connection_formats[websocket] = fmt
         
-        logger.info(f"User {user_id} connected to session {session_code} (host={is_host})")
+        logger.info(f"User {user_id} connected to session {session_code} (host={is_host}, fmt={fmt})")
 
     def disconnect(self, websocket: WebSocket, session_code: str, user_id: str):
-        if session_code in self.active_connections:
-            if websocket in self.active_connections[session_code]:
-                self.active_connections[session_code].remove(websocket)
-                if not self.active_connections[session_code]:
-                    del self.active_connections[session_code]
-        
-        if session_code in self.connection_roles:
-            if user_id in self.connection_roles[session_code]:
-                del self.connection_roles[session_code][user_id]
-            
-            # Clean up empty role tracking
-            if not self.connection_roles[session_code]:
-                del self.connection_roles[session_code]
+        connections = self.active_connections.get(session_code)
+        if connections is not None:
+            connections.discard(websocket)
+            if not connections:
+                self.active_connections.pop(session_code, None)
+        self.connection_formats.pop(websocket, None)
         
-        if user_id in self.user_connections:
+        # A stale socket closing after the user reconnected must leave the new
+        # connection's role and direct-message entry in place
+        if self.user_connections.get(user_id) is websocket:
             del self.user_connections[user_id]
+            roles = self.connection_roles.get(session_code)
+            if roles is not None:
+                roles.pop(user_id, None)
+                # Clean up empty role tracking
+                if not roles:
+                    self.connection_roles.pop(session_code, None)
             
         logger.info(f"User {user_id} disconnected from session {session_code}")
 
+    def is_host(self, session_code: str, user_id: str) -> bool:
+        """Whether user_id connected to the session as its host (no Redis lookup)"""
+        return self.connection_roles.get(session_code, {}).get(user_id, False)
+
     async def send_personal_message(self, message: dict, websocket: WebSocket = None, session_code: str = None, user_id: str = None):
         """Send message to a specific user. Can use either websocket directly or session_code + user_id"""
         if websocket is None:
@@ -60,58 +98,88 @@ class ConnectionManager:
                 logger.warning(f"Cannot send personal message: user {user_id} not found")
                 return
         
+        await self.send_encoded_message(EncodedMessage(message), websocket)
+
+    async def send_encoded_message(self, encoded: EncodedMessage, websocket: WebSocket):
+        """Send an already-built EncodedMessage (e.g. a constant error reply) to one websocket"""
         try:
-            await websocket.send_json(message)
+            await self._send(websocket, encoded)
         except Exception as e:
             logger.error(f"Error sending personal message: {e}")
 
+    async def _send(self, websocket: WebSocket, encoded: EncodedMessage):
+        frame = encoded.frame(self.connection_formats.get(websocket, JSON_FORMAT))
+        if isinstance(frame, bytes):
+            await websocket.send_bytes(frame)
+        else:
+            await websocket.send_text(frame)
+
+    async def _send_all(self, encoded: EncodedMessage, websockets: list[WebSocket]) -> list[BaseException | None]:
+        """Send a message to every websocket concurrently, so a slow client doesn't delay the rest.
+        The message is encoded once per wire format in use, not once per websocket.
+        Returns the per-websocket results, with the exception in place of any failed send."""
+        return await asyncio.gather(
+            *(self._send(websocket, encoded) for websocket in websockets),
+            return_exceptions=True
+        )
+
     async def broadcast_to_session(self, message: dict, session_code: str):
-        if session_code in self.active_connections:
-            for connection in self.active_connections[session_code]:
-                try:
-                    await connection.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to session {session_code}: {e}")
+        # Encode once per format, send the same frame to every connection
+        await self.broadcast_encoded_to_session(EncodedMessage(message), session_code)
+
+    async def broadcast_encoded_to_session(self, encoded: EncodedMessage, session_code: str):
+        """Broadcast an EncodedMessage, reusing any frames it already holds, to every connection in a session"""
+        connections = self.active_connections.get(session_code)
+        if not connections:
+            return
+        
+        results = await self._send_all(encoded, list(connections))
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error broadcasting to session {session_code}: {result}")
 
     async def broadcast_except(self, message: dict, session_code: str, exclude_user_id: str):
-        if session_code in self.active_connections:
-            exclude_ws = self.user_connections.get(exclude_user_id)
-            for connection in self.active_connections[session_code]:
-                if connection != exclude_ws:
-                    try:
-                        await connection.send_json(message)
-                    except Exception as e:
-                        logger.error(f"Error broadcasting (except) to session {session_code}: {e}")
+        connections = self.active_connections.get(session_code)
+        if not connections:
+            return
+        
+        exclude_ws = self.user_connections.get(exclude_user_id)
+        targets = [connection for connection in connections if connection != exclude_ws]
+        if not targets:
+            return
+        results = await self._send_all(EncodedMessage(message), targets)
+        for result in results:
+            if isinstance(result, Exception):
+                logger.error(f"Error broadcasting (except) to session {session_code}: {result}")
     
     async def broadcast_to_host(self, message: dict, session_code: str, host_id: str):
         """Send message specifically to the host"""
         host_ws = self.user_connections.get(host_id)
         if host_ws:
             try:
-                await host_ws.send_json(message)
+                await self._send(host_ws, EncodedMessage(message))
             except Exception as e:
                 logger.error(f"Error sending message to host {host_id}: {e}")
     
     async def broadcast_to_participants(self, message: dict, session_code: str):
         """Broadcast message to all participants (non-host users) in a session"""
-        if session_code not in self.active_connections:
+        roles = self.connection_roles.get(session_code)
+        if not roles or not self.active_connections.get(session_code):
             return
         
-        if session_code not in self.connection_roles:
-            return
-        
-        # Get list of participant user_ids (non-hosts)
-        participant_ids = [
-            user_id for user_id, is_host in self.connection_roles[session_code].items()
-            if not is_host
+        # Connected participants (non-hosts) and their websockets
+        user_connections = self.user_connections
+        targets = [
+            (user_id, user_connections[user_id]) for user_id, is_host in roles.items()
+            if not is_host and user_id in user_connections
         ]
+        if not targets:
+            return
         
-        for user_id in participant_ids:
-            if user_id in self.user_connections:
-                try:
-                    await self.user_connections[user_id].send_json(message)
-                except Exception as e:
-                    logger.error(f"Error broadcasting to participant {user_id}: {e}")
+        results = await self._send_all(EncodedMessage(message), [websocket for _, websocket in targets])
+        for (user_id, _), result in zip(targets, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error broadcasting to participant {user_id}: {result}")
 
 
 manager = ConnectionManager()
@@ -1,27 +1,67 @@
 import logging
+import time
 from datetime import datetime
 from typing import Dict, Any, Optional, List
-import json
+import orjson
 
-from app.core.database import redis_client, collection as quiz_collection
-from app.core.config import QUESTION_TIME_SECONDS
-from bson import ObjectId
+from app.core.database import redis_client
+from app.core.config import QUESTION_TIME_SECONDS, SESSION_EXPIRY_HOURS
+from app.services.quiz_cache import quiz_cache
+from app.services.session_manager import (
+    session_manager, participants_key, scores_key, answers_key, decode_participants, decode_score, score_increment
+)
 
 logger = logging.getLogger(__name__)
 
+# Per-participant question indices live as long as their session
+PARTICIPANT_INDEX_TTL_SECONDS = SESSION_EXPIRY_HOURS * 3600
+
+def question_indices_key(session_code: str) -> str:
+    """Redis hash of each participant's question index: field = user_id, value = index.
+    One key per session keeps user ids out of the keyspace (and its per-key TTL overhead)."""
+    return f"session:{session_code}:question_indices"
+
+def answered_key(session_code: str, question_index: int) -> str:
+    """Redis set of the user_ids that have answered a question"""
+    return f"session:{session_code}:answered:{question_index}"
+
+# Records an answer atomically in one round-trip: rejects a second answer to the same
+# question, appends the answer to the participant's answers list and adds to their score.
+# KEYS[1] = participants hash, KEYS[2] = scores sorted set, KEYS[3] = the question's answered set,
+# KEYS[4] = the participant's answers list; ARGV = user_id, answer JSON, scores set increment
+# The participant JSON is only checked for, never rewritten: the score lives in the scores set
+# and the answers in their own list, both given the participants hash's TTL.
+SUBMIT_ANSWER_LUA = """
+if redis.call('HEXISTS', KEYS[1], ARGV[1]) == 0 then
+    return {'not_found'}
+end
+if redis.call('SADD', KEYS[3], ARGV[1]) == 0 then
+    return {'duplicate'}
+end
+local ttl = redis.call('PTTL', KEYS[1])
+if redis.call('RPUSH', KEYS[4], ARGV[2]) == 1 and ttl > 0 then
+    redis.call('PEXPIRE', KEYS[4], ttl)
+end
+if redis.call('PTTL', KEYS[3]) < 0 and ttl > 0 then
+    redis.call('PEXPIRE', KEYS[3], ttl)
+end
+return {'recorded', redis.call('ZINCRBY', KEYS[2], ARGV[3], ARGV[1])}
+"""
+
 class GameController:
     def __init__(self):
         self.redis = redis_client
+        self._submit_script = self.redis.register_script(SUBMIT_ANSWER_LUA)
 
     async def get_current_question(self, session_code: str) -> Optional[Dict[str, Any]]:
         """Get the current question for the session"""
         session_key = f"session:{session_code}"
         
-        logger.info(f"📚 Getting current question for session {session_code}")
+        logger.debug("📚 Getting current question for session %s", session_code)
         
         # Get current index and quiz ID
         session_data = await self.redis.hmget(session_key, ["current_question_index", "quiz_id", "question_start_time"])
-        logger.info(f"📊 Session data from Redis: index={session_data[0]}, quiz_id={session_data[1]}")
+        logger.debug("📊 Session data from Redis: index=%s, quiz_id=%s", session_data[0], session_data[1])
         
         if not all(session_data[:2]): # Check if index and quiz_id exist
             logger.error(f"❌ Missing session data! index={session_data[0]}, quiz_id={session_data[1]}")
@@ -31,37 +71,34 @@ class GameController:
         quiz_id = session_data[1]
         start_time = session_data[2]
         
-        # Fetch quiz from MongoDB (could be cached in Redis for performance)
-        logger.info(f"🔍 Fetching quiz from MongoDB with ID: {quiz_id}")
-        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)})
+        # Fetch quiz (cached in Redis for the life of the session)
+        compiled = await quiz_cache.get_compiled(quiz_id)
         
-        if not quiz:
-            logger.error(f"❌ Quiz not found in MongoDB with ID: {quiz_id}")
+        if not compiled:
+            logger.error(f"❌ Quiz not found with ID: {quiz_id}")
             return None
             
+        quiz = compiled.quiz
         if "questions" not in quiz:
             logger.error(f"❌ Quiz {quiz_id} has no questions field!")
             return None
             
-        logger.info(f"✅ Quiz loaded successfully. Total questions: {len(quiz['questions'])}")
-            
         questions = quiz["questions"]
         if current_index >= len(questions):
             logger.warning(f"⚠️ Question index {current_index} out of range (total: {len(questions)})")
             return None
             
         question = questions[current_index]
-        
-        # Ensure question has required fields
-        question_text = question.get('questionText', question.get('question', ''))
-        question_type = question.get('type', 'single')
+        # Normalized client payload, built once when the quiz was cached
+        base_payload = compiled.question_payloads[current_index]
+        question_text = base_payload["question"]
         
         # Validate question text is not empty
         if not question_text or not question_text.strip():
             logger.error(f"❌ Question {current_index} has empty question text!")
             return None
         
-        logger.info(f"✅ Retrieved question {current_index + 1}/{len(questions)}: {question_text[:50]}...")
+        logger.debug("✅ Retrieved question %d/%d: %.50s", current_index + 1, len(questions), question_text)
         
         # Get per-question time limit (default to global config if not set)
         question_time_limit = question.get('timeLimit', QUESTION_TIME_SECONDS)
@@ -69,32 +106,14 @@ class GameController:
         # Calculate time remaining based on question's time limit
         time_remaining = question_time_limit
         if start_time:
-            elapsed = (datetime.utcnow() - datetime.fromisoformat(start_time)).total_seconds()
+            # Stored as a Unix timestamp; sessions started before that still hold an ISO string
+            try:
+                elapsed = time.time() - float(start_time)
+            except ValueError:
+                elapsed = (datetime.utcnow() - datetime.fromisoformat(start_time)).total_seconds()
             time_remaining = max(0, question_time_limit - int(elapsed))
         
-        # Build question payload with normalized field names
-        question_payload = {
-            "question": question_text,
-            "questionType": question_type,
-            "type": question_type,  # Keep for backward compatibility
-            "options": question.get('options', []),
-            "id": question.get('id', str(current_index)),
-            "timeLimit": question_time_limit,  # Include time limit in payload
-        }
-        
-        # Include optional fields if present
-        if 'correctAnswerIndex' in question:
-            question_payload['correctAnswerIndex'] = question['correctAnswerIndex']
-        if 'correctAnswerIndices' in question:
-            question_payload['correctAnswerIndices'] = question['correctAnswerIndices']
-        if 'dragItems' in question:
-            question_payload['dragItems'] = question['dragItems']
-        if 'dropTargets' in question:
-            question_payload['dropTargets'] = question['dropTargets']
-        if 'correctMatches' in question:
-            question_payload['correctMatches'] = question['correctMatches']
-        if 'imageUrl' in question:
-            question_payload['imageUrl'] = question['imageUrl']
+        question_payload = {**base_payload, "timeLimit": question_time_limit}
             
         return {
             "question": question_payload,
@@ -108,21 +127,21 @@ class GameController:
         """Process a participant's answer"""
         session_key = f"session:{session_code}"
         
-        # Get participant's current question index
-        current_index = await self.get_participant_question_index(session_code, user_id)
-        
-        logger.info(f"📝 Processing answer for user {user_id} on question {current_index}")
+        # Get participant's current question index and the session's quiz in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(question_indices_key(session_code), user_id)
+            pipe.hget(session_key, "quiz_id")
+            current_index, quiz_id = await pipe.execute()
+        current_index = int(current_index or 0)
         
-        # Get session state
-        session_data = await self.redis.hmget(session_key, ["quiz_id", "participants"])
-        quiz_id = session_data[0]
-        participants_json = session_data[1]
+        logger.debug("📝 Processing answer for user %s on question %s", user_id, current_index)
         
         if not quiz_id:
             return {"error": "Session not found"}
 
-        # Get correct answer
-        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)})
+        # Get the quiz with its pre-compiled answer keys
+        compiled = await quiz_cache.get_compiled(quiz_id)
+        quiz = compiled.quiz if compiled else None
         
         if not quiz or "questions" not in quiz:
             return {"error": "Quiz not found"}
@@ -132,37 +151,35 @@ class GameController:
         
         question = quiz["questions"][current_index]
         question_type = question.get("type", "singleMcq")
-        
-        logger.info(f"📝 Question type: {question_type}")
+        answer_key = compiled.answer_keys[current_index]
         
         # Handle different question types
         is_correct = False
         
         # Handle timeout (null answer)
         if answer is None:
-            logger.info(f"⏰ Timeout - user {user_id} did not answer in time")
+            logger.debug("⏰ Timeout - user %s did not answer in time", user_id)
             is_correct = False
         elif question_type in ["singleMcq", "trueFalse"]:
             # Single answer questions
-            correct_answer = question.get("correctAnswerIndex")
+            correct_answer = answer_key
             if correct_answer is None:
                 logger.error(f"❌ No correct answer found for question {current_index}")
                 return {"error": "Invalid question configuration"}
             
-            is_correct = int(answer) == int(correct_answer)
-            logger.info(f"🎯 Single answer check: user={user_id}, answer={answer}, correct={correct_answer}, is_correct={is_correct}")
+            is_correct = int(answer) == correct_answer
+            logger.debug("🎯 Single answer check: user=%s, answer=%s, correct=%s, is_correct=%s", user_id, answer, correct_answer, is_correct)
             
         elif question_type == "multiMcq":
             # Multiple answer questions with partial credit
-            correct_answers = question.get("correctAnswerIndices", [])
-            if not correct_answers:
+            correct_answers_set = answer_key
+            if not correct_answers_set:
                 logger.error(f"❌ No correct answers found for multi-choice question {current_index}")
                 return {"error": "Invalid question configuration"}
             
             # Answer should be a list of indices
             user_answers = answer if isinstance(answer, list) else [answer]
-            user_answers_set = set(int(a) for a in user_answers)
-            correct_answers_set = set(int(a) for a in correct_answers)
+            user_answers_set = frozenset(int(a) for a in user_answers)
             
             # Calculate partial credit
             # Correct selections: +points per correct answer
@@ -186,17 +203,14 @@ class GameController:
             
             is_correct = user_answers_set == correct_answers_set  # Full credit only if exact match
             
-            logger.info(f"🎯 Multi answer check: user={user_id}")
-            logger.info(f"   User answers: {user_answers_set}")
-            logger.info(f"   Correct answers: {correct_answers_set}")
-            logger.info(f"   ✅ Correct selections: {num_correct}/{total_correct}")
-            logger.info(f"   ❌ Wrong selections: {num_wrong}")
-            logger.info(f"   ⚠️ Missed selections: {len(missed_selections)}")
-            logger.info(f"   📊 Partial credit: {partial_credit * 100:.1f}%")
+            logger.debug(
+                "🎯 Multi answer check: user=%s, correct=%d/%d, wrong=%d, missed=%d, partial credit=%.1f%%",
+                user_id, num_correct, total_correct, num_wrong, len(missed_selections), partial_credit * 100
+            )
             
         elif question_type == "dragAndDrop":
             # Drag and drop questions
-            correct_matches = question.get("correctMatches", {})
+            correct_matches = answer_key
             if not correct_matches:
                 logger.error(f"❌ No correct matches found for drag-drop question {current_index}")
                 return {"error": "Invalid question configuration"}
@@ -204,7 +218,7 @@ class GameController:
             # Answer should be a dict/object of matches
             user_matches = answer if isinstance(answer, dict) else {}
             is_correct = user_matches == correct_matches
-            logger.info(f"🎯 Drag-drop check: user={user_id}, matches={user_matches}, correct={correct_matches}, is_correct={is_correct}")
+            logger.debug("🎯 Drag-drop check: user=%s, matches=%s, correct=%s, is_correct=%s", user_id, user_matches, correct_matches, is_correct)
         
         else:
             logger.error(f"❌ Unknown question type: {question_type}")
@@ -238,13 +252,13 @@ class GameController:
             points = partial_points + time_bonus
             
             if partial_credit == 1.0:
-                logger.info(f"✅ Perfect answer! Base: {base_points}, Time bonus: {time_bonus} (multiplier: {multiplier:.2f}x), Total: {points}")
+                logger.debug("✅ Perfect answer! Base: %d, Time bonus: %d (multiplier: %.2fx), Total: %d", base_points, time_bonus, multiplier, points)
             elif partial_credit > 0:
-                logger.info(f"⚠️ Partial credit! Base: {base_points} × {partial_credit:.2f} = {partial_points}, Time bonus: {time_bonus}, Total: {points}")
+                logger.debug("⚠️ Partial credit! Base: %d × %.2f = %d, Time bonus: %d, Total: %d", base_points, partial_credit, partial_points, time_bonus, points)
             else:
-                logger.info(f"❌ No points (wrong selections outweigh correct ones)")
+                logger.debug("❌ No points (wrong selections outweigh correct ones)")
             
-            logger.info(f"⏱️ Time stats: elapsed={timestamp:.2f}s, limit={question_time_limit}s")
+            logger.debug("⏱️ Time stats: elapsed=%ss, limit=%ss", timestamp, question_time_limit)
             
         elif is_correct:
             # Full credit for other question types
@@ -262,34 +276,35 @@ class GameController:
                 time_bonus = int(base_points * (multiplier - 1))
             
             points = base_points + time_bonus
-            logger.info(f"✅ Correct answer! Base: {base_points}, Time bonus: {time_bonus} (multiplier: {multiplier:.2f}x), Total: {points}")
-            logger.info(f"⏱️ Time stats: elapsed={timestamp:.2f}s, limit={question_time_limit}s")
-        
-        # Update participant data
-        participants = json.loads(participants_json)
-        if user_id in participants:
-            participant = participants[user_id]
-            
-            # Check if already answered
-            for ans in participant["answers"]:
-                if ans["question_index"] == current_index:
-                    logger.warning(f"⚠️ User {user_id} already answered question {current_index}")
-                    return {"error": "Already answered"}
-            
-            # Record answer
-            participant["answers"].append({
+            logger.debug("✅ Correct answer! Base: %d, Time bonus: %d (multiplier: %.2fx), Total: %d", base_points, time_bonus, multiplier, points)
+            logger.debug("⏱️ Time stats: elapsed=%ss, limit=%ss", timestamp, question_time_limit)
+        
+        # Stored timestamps are kept to millisecond precision; a full float repr is up to
+        # 17 digits and this record is re-sent with every participant read
+        stored_timestamp = round(timestamp, 3) if isinstance(timestamp, float) else timestamp
+        
+        # Record answer and update the score atomically on the Redis server
+        status, *rest = await self._submit_script(
+            keys=[
+                participants_key(session_code), scores_key(session_code),
+                answered_key(session_code, current_index), answers_key(session_code, user_id)
+            ],
+            args=[user_id, orjson.dumps({
                 "question_index": current_index,
                 "answer": answer,
-                "timestamp": timestamp,
+                "timestamp": stored_timestamp,
                 "is_correct": is_correct,
                 "points_earned": points
-            })
-            participant["score"] += points
-            
-            # Save back to Redis
-            await self.redis.hset(session_key, "participants", json.dumps(participants))
-            
-            logger.info(f"💾 Saved answer for {user_id}: score now {participant['score']}")
+            }), score_increment(points)]
+        )
+        
+        if status == "duplicate":
+            logger.warning(f"⚠️ User {user_id} already answered question {current_index}")
+            return {"error": "Already answered"}
+        
+        if status == "recorded":
+            new_total_score = decode_score(rest[0])[0]
+            logger.info("💾 Saved answer for %s: score now %s", user_id, new_total_score)
             
             # Return correct answer based on question type
             correct_answer_response = None
@@ -310,7 +325,7 @@ class GameController:
                 "multiplier": round(multiplier, 2),
                 "correct_answer": correct_answer_response,
                 "user_answer": stored_answer,
-                "new_total_score": participant["score"],
+                "new_total_score": new_total_score,
                 "question_type": question_type
             }
             
@@ -328,11 +343,11 @@ class GameController:
         """Move to the next question"""
         session_key = f"session:{session_code}"
         
-        # Increment index
-        current_index = await self.redis.hincrby(session_key, "current_question_index", 1)
-        
-        # Reset start time
-        await self.redis.hset(session_key, "question_start_time", datetime.utcnow().isoformat())
+        # Increment index and reset start time in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hincrby(session_key, "current_question_index", 1)
+            pipe.hset(session_key, "question_start_time", time.time())
+            await pipe.execute()
         
         return True
 
@@ -340,11 +355,11 @@ class GameController:
         """Advance to and return the next question"""
         session_key = f"session:{session_code}"
         
-        # Increment index
-        await self.redis.hincrby(session_key, "current_question_index", 1)
-        
-        # Reset start time for the new question
-        await self.redis.hset(session_key, "question_start_time", datetime.utcnow().isoformat())
+        # Increment index and reset start time for the new question in one round trip
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hincrby(session_key, "current_question_index", 1)
+            pipe.hset(session_key, "question_start_time", time.time())
+            await pipe.execute()
         
         # Return the new current question
         return await self.get_current_question(session_code)
@@ -352,49 +367,46 @@ class GameController:
     async def start_question_timer(self, session_code: str):
         """Start the timer for the current question"""
         session_key = f"session:{session_code}"
-        await self.redis.hset(session_key, "question_start_time", datetime.utcnow().isoformat())
+        await self.redis.hset(session_key, "question_start_time", time.time())
 
     async def check_all_answered(self, session_code: str) -> bool:
         """Check if all connected participants have answered the current question"""
-        session_key = f"session:{session_code}"
-        session_data = await self.redis.hmget(session_key, ["current_question_index", "participants"])
-        current_index = int(session_data[0])
-        participants = json.loads(session_data[1])
-        
-        for p in participants.values():
-            if p.get("connected", False):
-                has_answered = any(a["question_index"] == current_index for a in p["answers"])
-                if not has_answered:
-                    return False
-        return True
+        current_index, participants = await self._current_index_and_participants(session_code)
+        answered = await self.redis.smembers(answered_key(session_code, current_index))
+        
+        return all(
+            user_id in answered
+            for user_id, p in participants.items()
+            if p.get("connected", False)
+        )
 
     async def get_answer_distribution(self, session_code: str) -> Dict[str, int]:
         """Calculate answer distribution statistics for current question"""
-        session_key = f"session:{session_code}"
-        session_data = await self.redis.hmget(session_key, ["current_question_index", "participants"])
-        current_index = int(session_data[0])
-        participants = json.loads(session_data[1])
+        current_index = int(await self.redis.hget(f"session:{session_code}", "current_question_index"))
+        # Only the participants in the question's answered set have an answer to count
+        answered = await self.redis.smembers(answered_key(session_code, current_index))
+        answers = await session_manager.get_answers(session_code, list(answered))
         
         distribution = {}
-        for p in participants.values():
-            for ans in p["answers"]:
+        for user_answers in answers.values():
+            for ans in user_answers:
                 if ans["question_index"] == current_index:
                     answer_key = str(ans["answer"])
                     distribution[answer_key] = distribution.get(answer_key, 0) + 1
         
         return distribution
 
+    async def _current_index_and_participants(self, session_code: str):
+        """The session's current question index and all its participants, in one round trip"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hget(f"session:{session_code}", "current_question_index")
+            pipe.hgetall(participants_key(session_code))
+            current_index, participants = await pipe.execute()
+        return int(current_index), decode_participants(participants)
+
     async def calculate_accuracy(self, session_code: str, user_id: str) -> float:
         """Calculate accuracy percentage for a participant"""
-        session_key = f"session:{session_code}"
-        participants_json = await self.redis.hget(session_key, "participants")
-        participants = json.loads(participants_json)
-        
-        if user_id not in participants:
-            return 0.0
-        
-        participant = participants[user_id]
-        answers = participant.get("answers", [])
+        answers = (await session_manager.get_answers(session_code, [user_id]))[user_id]
         
         if not answers:
             return 0.0
@@ -403,48 +415,50 @@ class GameController:
         return (correct_count / len(answers)) * 100
 
     async def get_participant_question_index(self, session_code: str, user_id: str) -> int:
-        """Get the current question index for a specific participant"""
-        session_key = f"session:{session_code}"
-        participant_key = f"participant:{session_code}:{user_id}:question_index"
-        
-        # Try to get from Redis first
-        index = await self.redis.get(participant_key)
-        
-        if index is not None:
-            logger.info(f"📊 PROGRESS - Found cached index for {user_id}: {int(index)}")
-            return int(index)
-        
-        # If not found, check their answers to determine progress
-        logger.info(f"🔍 PROGRESS - No cached index for {user_id}, checking answers")
-        participants_json = await self.redis.hget(session_key, "participants")
-        if participants_json:
-            participants = json.loads(participants_json)
-            if user_id in participants:
-                answers = participants[user_id].get("answers", [])
-                # Return the highest question index they've answered
-                if answers:
-                    max_index = max(ans["question_index"] for ans in answers)
-                    logger.info(f"📊 PROGRESS - Calculated index from answers for {user_id}: {max_index}")
-                    return max_index
-        
-        logger.info(f"📊 PROGRESS - No progress found for {user_id}, defaulting to 0")
-        return 0  # Default to first question
+        """Get the current question index for a specific participant (0 until one is set)"""
+        index = await self.redis.hget(question_indices_key(session_code), user_id)
+        return int(index) if index is not None else 0
+
+    async def get_participant_question_indices(self, session_code: str, user_ids: List[str]) -> List[int]:
+        """Get the current question index for several participants in one round trip"""
+        if not user_ids:
+            return []
+        
+        indices = await self.redis.hmget(question_indices_key(session_code), user_ids)
+        return [int(index) if index is not None else 0 for index in indices]
 
     async def set_participant_question_index(self, session_code: str, user_id: str, index: int):
         """Set the current question index for a specific participant"""
-        participant_key = f"participant:{session_code}:{user_id}:question_index"
-        await self.redis.set(participant_key, index)
-        logger.info(f"✅ PROGRESS - Set {user_id} question index to {index}")
+        key = question_indices_key(session_code)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, user_id, index)
+            pipe.expire(key, PARTICIPANT_INDEX_TTL_SECONDS)
+            await pipe.execute()
+        logger.debug("✅ PROGRESS - Set %s question index to %s", user_id, index)
+
+    async def set_participant_question_indices(self, session_code: str, user_ids: List[str], index: int):
+        """Set the same question index for several participants in one round trip"""
+        if not user_ids:
+            return
+        key = question_indices_key(session_code)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hset(key, mapping={user_id: index for user_id in user_ids})
+            pipe.expire(key, PARTICIPANT_INDEX_TTL_SECONDS)
+            await pipe.execute()
+        logger.debug("✅ PROGRESS - Set %d participants' question index to %s", len(user_ids), index)
 
     async def get_total_questions(self, session_code: str) -> int:
         """Get total number of questions in the quiz"""
         session_key = f"session:{session_code}"
-        quiz_id = await self.redis.hget(session_key, "quiz_id")
+        # create_session records the count, so the quiz itself is only read for older sessions
+        total_questions, quiz_id = await self.redis.hmget(session_key, ["total_questions", "quiz_id"])
+        if total_questions is not None:
+            return int(total_questions)
         
         if not quiz_id:
             return 0
         
-        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)})
+        quiz = await quiz_cache.get(quiz_id)
         if not quiz or "questions" not in quiz:
             return 0
         
@@ -454,7 +468,7 @@ class GameController:
         """Get a specific question by index"""
         session_key = f"session:{session_code}"
         
-        logger.info(f"📚 Getting question {index} for session {session_code}")
+        logger.debug("📚 Getting question %s for session %s", index, session_code)
         
         # Get quiz ID and session time settings
         session_data = await self.redis.hmget(session_key, ["quiz_id", "per_question_time_limit"])
@@ -465,57 +479,31 @@ class GameController:
             logger.error(f"❌ Quiz ID not found for session {session_code}")
             return None
         
-        # Fetch quiz from MongoDB
-        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)})
+        # Fetch quiz (cached in Redis for the life of the session)
+        compiled = await quiz_cache.get_compiled(quiz_id)
         
-        if not quiz or "questions" not in quiz:
+        if not compiled or "questions" not in compiled.quiz:
             logger.error(f"❌ Quiz or questions not found")
             return None
         
-        questions = quiz["questions"]
+        questions = compiled.quiz["questions"]
         
         if index >= len(questions):
             logger.warning(f"⚠️ Question index {index} out of range (total: {len(questions)})")
             return None
         
-        question = questions[index]
-        
-        # Ensure question has required fields
-        question_text = question.get('questionText', question.get('question', ''))
-        question_type = question.get('type', 'single')
+        base_payload = compiled.question_payloads[index]
+        question_text = base_payload["question"]
         
         if not question_text or not question_text.strip():
             logger.error(f"❌ Question {index} has empty question text!")
             return None
         
-        logger.info(f"✅ Retrieved question {index + 1}/{len(questions)}: {question_text[:50]}...")
+        logger.debug("✅ Retrieved question %d/%d: %.50s", index + 1, len(questions), question_text)
         
         # Use session's per-question time limit (set by host)
         question_time_limit = session_per_question_limit
-        
-        # Build question payload
-        question_payload = {
-            "question": question_text,
-            "questionType": question_type,
-            "type": question_type,
-            "options": question.get('options', []),
-            "id": question.get('id', str(index)),
-            "timeLimit": question_time_limit,
-        }
-        
-        # Include optional fields
-        if 'correctAnswerIndex' in question:
-            question_payload['correctAnswerIndex'] = question['correctAnswerIndex']
-        if 'correctAnswerIndices' in question:
-            question_payload['correctAnswerIndices'] = question['correctAnswerIndices']
-        if 'dragItems' in question:
-            question_payload['dragItems'] = question['dragItems']
-        if 'dropTargets' in question:
-            question_payload['dropTargets'] = question['dropTargets']
-        if 'correctMatches' in question:
-            question_payload['correctMatches'] = question['correctMatches']
-        if 'imageUrl' in question:
-            question_payload['imageUrl'] = question['imageUrl']
+        question_payload = {**base_payload, "timeLimit": question_time_limit}
         
         return {
             "question": question_payload,
@@ -523,4 +511,8 @@ class GameController:
             "total": len(questions),
             "time_remaining": question_time_limit,
             "time_limit": question_time_limit
-        }
\ No newline at end of file
+        }
+
+
+# Global instance
+game_controller = GameController()
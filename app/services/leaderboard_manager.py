@@ -1,54 +1,165 @@
+import asyncio
 import logging
-import json
-from typing import List, Dict, Any
-from app.core.database import redis_client
+from typing import List, Dict, Any, Optional, Set, Tuple
+from app.core.database import redis_client, redis_replica_client
+from app.services.connection_manager import EncodedMessage, manager
+from app.services.session_manager import session_manager, participants_key, scores_key, decode_participants, decode_score
 
 logger = logging.getLogger(__name__)
 
+# Answers arriving within this window share a single leaderboard broadcast
+BROADCAST_INTERVAL_SECONDS = 0.25
+# Sessions whose leaderboard is kept in-process; oldest entries are dropped past this many
+# (sessions that are abandoned or expire never reach forget())
+LEADERBOARD_CACHE_LIMIT = 256
+
 class LeaderboardManager:
     def __init__(self):
         self.redis = redis_client
+        # Reads that may lag the primary slightly (the throttled broadcast) go here
+        self.replica = redis_replica_client
+        # session_code -> (raw Redis fields it was built from, leaderboard, encoded leaderboard_update or None)
+        self._cache: Dict[str, Tuple[Tuple, List[Dict[str, Any]], Optional[EncodedMessage]]] = {}
+        # session_code -> timer for the leaderboard broadcast waiting to go out
+        self._pending_lb: Dict[str, asyncio.TimerHandle] = {}
+        self._broadcast_tasks: Set[asyncio.Task] = set()
 
-    async def get_leaderboard(self, session_code: str) -> List[Dict[str, Any]]:
+    async def _current_entry(self, session_code: str,
+                             replica: bool = False) -> Tuple[Tuple, List[Dict[str, Any]], Optional[EncodedMessage]]:
+        """Cache entry for a session, rebuilt only when its participants / question fields in Redis changed.
+        With replica=True the fields are read from the read replica (when configured)."""
+        session_key = f"session:{session_code}"
+        client = self.replica if replica else self.redis
+        
+        # Ranking from the scores set, participants' display fields and the current question index
+        async with client.pipeline(transaction=False) as pipe:
+            pipe.zrevrange(scores_key(session_code), 0, -1, withscores=True)
+            pipe.hgetall(participants_key(session_code))
+            pipe.hmget(session_key, ["current_question_index", "total_questions"])
+            ranked, participants, (current_index, total_questions) = await pipe.execute()
+        source = (ranked, participants, current_index, total_questions)
+        
+        entry = self._cache.get(session_code)
+        if entry is None or entry[0] != source:
+            leaderboard = self._build_leaderboard(session_code, ranked, participants, current_index, total_questions)
+            entry = (source, leaderboard, None)
+            self._store(session_code, entry)
+        return entry
+
+    def _store(self, session_code: str, entry: Tuple[Tuple, List[Dict[str, Any]], Optional[EncodedMessage]]):
+        """Cache a session's entry as the newest, dropping the oldest past LEADERBOARD_CACHE_LIMIT"""
+        self._cache.pop(session_code, None)
+        if len(self._cache) >= LEADERBOARD_CACHE_LIMIT:
+            del self._cache[next(iter(self._cache))]
+        self._cache[session_code] = entry
+
+    async def get_leaderboard(self, session_code: str, top_k: Optional[int] = None) -> List[Dict[str, Any]]:
         """
         Get real-time leaderboard for a session
-        Returns sorted list of participants with rankings
+        Returns sorted list of participants with rankings (only the first top_k if given)
         """
-        session_key = f"session:{session_code}"
-        
-        # Get participants and current question index
-        session_data = await self.redis.hmget(
-            session_key, 
-            ["participants", "current_question_index", "total_questions"]
+        if top_k is not None:
+            return await self._top_leaderboard(session_code, top_k)
+        _, leaderboard, _ = await self._current_entry(session_code, replica=True)
+        # Copies, so callers adding fields (e.g. final results) don't alter the cached entries
+        return [dict(entry) for entry in leaderboard]
+
+    async def _top_leaderboard(self, session_code: str, top_k: int) -> List[Dict[str, Any]]:
+        """The first top_k leaderboard entries, reading only those participants' fields"""
+        if top_k <= 0:
+            return []
+        ranked = await self.replica.zrevrange(scores_key(session_code), 0, top_k - 1, withscores=True)
+        if not ranked:
+            return []
+        user_ids = [user_id for user_id, _ in ranked]
+        async with self.replica.pipeline(transaction=False) as pipe:
+            pipe.hmget(participants_key(session_code), user_ids)
+            pipe.hmget(f"session:{session_code}", ["current_question_index", "total_questions"])
+            participants, (current_index, total_questions) = await pipe.execute()
+        raw_participants = {
+            user_id: participant for user_id, participant in zip(user_ids, participants) if participant is not None
+        }
+        return self._build_leaderboard(session_code, ranked, raw_participants, current_index, total_questions)
+
+    async def get_leaderboard_update(self, session_code: str, replica: bool = False) -> EncodedMessage:
+        """The leaderboard_update message for a session, encoded once per wire format per leaderboard change"""
+        source, leaderboard, encoded = await self._current_entry(session_code, replica)
+        if encoded is None:
+            encoded = EncodedMessage({
+                "type": "leaderboard_update",
+                "payload": {"leaderboard": leaderboard}
+            })
+            self._store(session_code, (source, leaderboard, encoded))
+        return encoded
+
+    def schedule_broadcast(self, session_code: str):
+        """
+        Broadcast the leaderboard to a session within BROADCAST_INTERVAL_SECONDS.
+        Calls made while a broadcast is already pending are covered by it, so a
+        burst of answers produces one fan-out instead of one per answer.
+        """
+        if session_code in self._pending_lb:
+            return
+        loop = asyncio.get_running_loop()
+        self._pending_lb[session_code] = loop.call_later(
+            BROADCAST_INTERVAL_SECONDS, self._start_broadcast, session_code
         )
-        
-        if not session_data[0]:
+
+    def _start_broadcast(self, session_code: str):
+        self._pending_lb.pop(session_code, None)
+        task = asyncio.create_task(self._broadcast(session_code))
+        # Keep a reference until done so the task isn't garbage collected mid-send
+        self._broadcast_tasks.add(task)
+        task.add_done_callback(self._broadcast_tasks.discard)
+
+    async def _broadcast(self, session_code: str):
+        try:
+            # Throttled, so a snapshot a few milliseconds behind the primary is fine
+            leaderboard_update = await self.get_leaderboard_update(session_code, replica=True)
+            await manager.broadcast_encoded_to_session(leaderboard_update, session_code)
+            logger.debug("🏆 LEADERBOARD - Broadcast update to session %s", session_code)
+        except Exception as e:
+            logger.error(f"Error broadcasting leaderboard for session {session_code}: {e}")
+
+    def forget(self, session_code: str):
+        """Drop the cached leaderboard and any pending broadcast once a session has ended"""
+        self._cache.pop(session_code, None)
+        pending = self._pending_lb.pop(session_code, None)
+        if pending is not None:
+            pending.cancel()
+
+    @staticmethod
+    def _build_leaderboard(session_code: str, ranked: List[Tuple[str, float]], raw_participants: Dict[str, str],
+                           current_index: Optional[str], total_questions: Optional[str]) -> List[Dict[str, Any]]:
+        """Leaderboard entries in the scores set's order (points descending, then fewer answers),
+        the same order get_participant_rank reports"""
+        if not raw_participants:
             logger.warning(f"No participants found for session {session_code}")
             return []
         
-        participants = json.loads(session_data[0])
-        current_index = int(session_data[1] or 0)
-        total_questions = int(session_data[2] or 0)
+        participants = decode_participants(raw_participants)
+        current_index = int(current_index or 0)
+        total_questions = int(total_questions or 0)
         
         # Build leaderboard data
         leaderboard = []
-        for user_id, participant in participants.items():
-            # Count answered questions
-            answered_count = len(participant.get("answers", []))
+        for user_id, value in ranked:
+            participant = participants.get(user_id)
+            if participant is None:
+                continue
+            # Score and answered question count, both from the scores set
+            score, answered_count = decode_score(value)
             
             leaderboard.append({
                 "user_id": user_id,
                 "username": participant.get("username", "Anonymous"),
-                "score": participant.get("score", 0),
+                "score": score,
                 "answered_count": answered_count,
                 "total_questions": total_questions,
                 "current_question": current_index + 1,
                 "is_connected": participant.get("connected", False),
             })
         
-        # Sort by score (descending), then by answered_count (ascending - faster is better)
-        leaderboard.sort(key=lambda x: (-x["score"], x["answered_count"]))
-        
         # Add position/rank
         for idx, entry in enumerate(leaderboard):
             entry["position"] = idx + 1
@@ -58,49 +169,53 @@ class LeaderboardManager:
         return leaderboard
 
     async def get_participant_rank(self, session_code: str, user_id: str) -> Dict[str, Any]:
-        """Get rank info for a specific participant"""
-        leaderboard = await self.get_leaderboard(session_code)
+        """Get rank info for a specific participant from the scores sorted set (no participant JSON)"""
+        key = scores_key(session_code)
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.zrevrank(key, user_id)
+            pipe.zscore(key, user_id)
+            pipe.zcard(key)
+            rank, score, total_participants = await pipe.execute()
         
-        for entry in leaderboard:
-            if entry["user_id"] == user_id:
-                return {
-                    "position": entry["position"],
-                    "score": entry["score"],
-                    "total_participants": len(leaderboard)
-                }
+        if rank is None:
+            return {"position": None, "score": 0, "total_participants": total_participants}
         
-        return {"position": None, "score": 0, "total_participants": len(leaderboard)}
+        return {
+            "position": rank + 1,
+            "score": decode_score(score)[0],
+            "total_participants": total_participants
+        }
 
     async def calculate_final_results(self, session_code: str) -> List[Dict[str, Any]]:
         """Calculate final results with additional stats"""
-        leaderboard = await self.get_leaderboard(session_code)
+        _, cached_leaderboard, _ = await self._current_entry(session_code)
+        # Copies, so the added stats don't alter the cached entries
+        leaderboard = [dict(entry) for entry in cached_leaderboard]
+        
+        # Every ranked participant's answers, in one round trip
+        all_answers = await session_manager.get_answers(session_code, [entry["user_id"] for entry in leaderboard])
         
         # Add accuracy and performance metrics
         for entry in leaderboard:
-            user_id = entry["user_id"]
+            answers = all_answers[entry["user_id"]]
             
-            # Get participant answers
-            session_key = f"session:{session_code}"
-            participants_json = await self.redis.hget(session_key, "participants")
-            participants = json.loads(participants_json)
-            
-            if user_id in participants:
-                participant = participants[user_id]
-                answers = participant.get("answers", [])
-                
-                # Calculate accuracy
-                if answers:
-                    correct_count = sum(1 for ans in answers if ans.get("is_correct", False))
-                    entry["accuracy"] = round((correct_count / len(answers)) * 100, 1)
-                    entry["correct_answers"] = correct_count
-                    entry["wrong_answers"] = len(answers) - correct_count
-                else:
-                    entry["accuracy"] = 0.0
-                    entry["correct_answers"] = 0
-                    entry["wrong_answers"] = 0
+            # Calculate accuracy
+            if answers:
+                correct_count = sum(1 for ans in answers if ans.get("is_correct", False))
+                entry["accuracy"] = round((correct_count / len(answers)) * 100, 1)
+                entry["correct_answers"] = correct_count
+                entry["wrong_answers"] = len(answers) - correct_count
+            else:
+                entry["accuracy"] = 0.0
+                entry["correct_answers"] = 0
+                entry["wrong_answers"] = 0
         
         return leaderboard
 
     async def get_final_results(self, session_code: str) -> List[Dict[str, Any]]:
         """Get final results - alias for calculate_final_results"""
         return await self.calculate_final_results(session_code)
+
+
+# Global instance, shared by every router so per-instance state (e.g. the leaderboard cache) is process-wide
+leaderboard_manager = LeaderboardManager()
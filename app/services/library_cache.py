@@ -0,0 +1,82 @@
+import logging
+from typing import Optional, Tuple
+
+from app.core.database import redis_client
+from app.core.config import LIBRARY_CACHE_TTL_SECONDS
+
+logger = logging.getLogger(__name__)
+
+# Writes a page only if the user's library generation is still the one read before the
+# response was built, so a body rendered before an invalidate() can't be cached after it.
+# KEYS[1] = library hash, KEYS[2] = generation counter; ARGV = page, payload, generation, TTL
+SET_IF_CURRENT_LUA = """
+if (redis.call('GET', KEYS[2]) or '') ~= ARGV[3] then
+    return 0
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+redis.call('EXPIRE', KEYS[1], ARGV[4])
+return 1
+"""
+
+class LibraryCache:
+    """Short-lived Redis cache for per-user library responses"""
+
+    def __init__(self):
+        self.redis = redis_client
+        self._set_script = self.redis.register_script(SET_IF_CURRENT_LUA)
+
+    @staticmethod
+    def _key(user_id: str) -> str:
+        # One hash per user with a field per page, so a single DEL drops every page
+        return f"library:{user_id}"
+
+    @staticmethod
+    def _generation_key(user_id: str) -> str:
+        # Bumped by every invalidate(), so an in-flight response can tell it went stale
+        return f"library:{user_id}:generation"
+
+    async def get(self, user_id: str, page: str) -> Tuple[Optional[str], Optional[str]]:
+        """Return the cached JSON library response for a user's page (if any) and the
+        library's current generation, which set() needs to cache a freshly built page"""
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.hget(self._key(user_id), page)
+                pipe.get(self._generation_key(user_id))
+                cached, generation = await pipe.execute()
+            return cached, generation or ""
+        except Exception as e:
+            logger.error(f"Error reading library cache for {user_id}: {e}")
+            return None, None
+
+    async def set(self, user_id: str, page: str, payload: str, generation: Optional[str]):
+        """Cache a serialized library response for a user's page, unless the library was
+        invalidated since get() returned generation"""
+        if generation is None:
+            return
+        try:
+            await self._set_script(
+                keys=[self._key(user_id), self._generation_key(user_id)],
+                args=[page, payload, generation, LIBRARY_CACHE_TTL_SECONDS]
+            )
+        except Exception as e:
+            logger.error(f"Error writing library cache for {user_id}: {e}")
+
+    async def invalidate(self, *user_ids: Optional[str]):
+        """Drop cached library responses after a write to any of the users' libraries"""
+        user_ids = [user_id for user_id in user_ids if user_id]
+        if not user_ids:
+            return
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.delete(*(self._key(user_id) for user_id in user_ids))
+                for user_id in user_ids:
+                    generation_key = self._generation_key(user_id)
+                    pipe.incr(generation_key)
+                    pipe.expire(generation_key, LIBRARY_CACHE_TTL_SECONDS)
+                await pipe.execute()
+        except Exception as e:
+            logger.error(f"Error invalidating library cache for {user_ids}: {e}")
+
+
+# Global instance
+library_cache = LibraryCache()
@@ -0,0 +1,130 @@
+import orjson
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+from bson import ObjectId
+
+from app.core.database import redis_client, collection as quiz_collection
+from app.core.config import SESSION_EXPIRY_HOURS
+
+logger = logging.getLogger(__name__)
+
+# Only the fields live sessions read; cached for as long as a session can last
+CACHED_QUIZ_FIELDS = {"_id": 0, "title": 1, "questions": 1}
+QUIZ_CACHE_TTL_SECONDS = SESSION_EXPIRY_HOURS * 3600
+# Decoded quizzes kept in-process; oldest entries are dropped past this many
+DECODED_QUIZ_LIMIT = 256
+
+def compile_answer_key(question: Dict[str, Any]) -> Any:
+    """Pre-build the form submit_answer compares against: an int for single-answer
+    questions, a frozenset for multiMcq, the matches dict for dragAndDrop (None if unset)"""
+    question_type = question.get("type", "singleMcq")
+    try:
+        if question_type in ("singleMcq", "trueFalse"):
+            correct = question.get("correctAnswerIndex")
+            return int(correct) if correct is not None else None
+        if question_type == "multiMcq":
+            return frozenset(int(a) for a in question.get("correctAnswerIndices") or []) or None
+        if question_type == "dragAndDrop":
+            return question.get("correctMatches") or None
+    except (TypeError, ValueError):
+        logger.error(f"Malformed answer key on question {question.get('id')}")
+    return None
+
+# Question fields forwarded to clients as-is when the question has them
+OPTIONAL_QUESTION_FIELDS = (
+    "correctAnswerIndex", "correctAnswerIndices", "dragItems", "dropTargets", "correctMatches", "imageUrl"
+)
+
+def build_question_payload(question: Dict[str, Any], index: int) -> Dict[str, Any]:
+    """Client-facing question with normalized field names (timeLimit is added per send)"""
+    question_type = question.get("type", "single")
+    payload = {
+        "question": question.get("questionText", question.get("question", "")),
+        "questionType": question_type,
+        "type": question_type,  # Keep for backward compatibility
+        "options": question.get("options", []),
+        "id": question.get("id", str(index)),
+    }
+    for field in OPTIONAL_QUESTION_FIELDS:
+        if field in question:
+            payload[field] = question[field]
+    return payload
+
+class CompiledQuiz:
+    """A decoded quiz with its per-question answer keys and client payloads built once"""
+
+    __slots__ = ("quiz", "answer_keys", "question_payloads")
+
+    def __init__(self, quiz: Dict[str, Any]):
+        questions = quiz.get("questions") or []
+        self.quiz = quiz
+        self.answer_keys: List[Any] = [compile_answer_key(question) for question in questions]
+        self.question_payloads: List[Dict[str, Any]] = [
+            build_question_payload(question, index) for index, question in enumerate(questions)
+        ]
+
+class QuizCache:
+    """Redis cache of the quiz title/questions read on every live-session event"""
+
+    def __init__(self):
+        self.redis = redis_client
+        # quiz_id -> (cached Redis value, compiled quiz); reused only while Redis still
+        # holds the identical value, so edits via invalidate() are picked up
+        self._decoded: Dict[str, Tuple[str, CompiledQuiz]] = {}
+
+    @staticmethod
+    def _key(quiz_id: str) -> str:
+        return f"quiz:{quiz_id}"
+
+    async def get(self, quiz_id: str) -> Optional[Dict[str, Any]]:
+        """Return the quiz's title and questions, from Redis when cached, else from MongoDB.
+        The returned dict is shared between callers and must not be mutated."""
+        compiled = await self.get_compiled(quiz_id)
+        return compiled.quiz if compiled else None
+
+    async def get_compiled(self, quiz_id: str) -> Optional[CompiledQuiz]:
+        """Return the quiz with its answer keys and question payloads (shared, read-only)"""
+        key = self._key(quiz_id)
+        try:
+            cached = await self.redis.get(key)
+            if cached is not None:
+                return self._decode(quiz_id, cached)
+        except Exception as e:
+            logger.error(f"Error reading quiz cache for {quiz_id}: {e}")
+
+        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)}, CACHED_QUIZ_FIELDS)
+        if not quiz:
+            return None
+
+        encoded = orjson.dumps(quiz, default=str)
+        try:
+            await self.redis.setex(key, QUIZ_CACHE_TTL_SECONDS, encoded)
+        except Exception as e:
+            logger.error(f"Error writing quiz cache for {quiz_id}: {e}")
+        return self._decode(quiz_id, encoded.decode())
+
+    def _decode(self, quiz_id: str, cached: str) -> CompiledQuiz:
+        """Parse and compile a cached quiz, unless this exact value was compiled last time"""
+        entry = self._decoded.get(quiz_id)
+        if entry is not None and entry[0] == cached:
+            return entry[1]
+
+        compiled = CompiledQuiz(orjson.loads(cached))
+        self._decoded.pop(quiz_id, None)
+        if len(self._decoded) >= DECODED_QUIZ_LIMIT:
+            del self._decoded[next(iter(self._decoded))]
+        self._decoded[quiz_id] = (cached, compiled)
+        return compiled
+
+    async def invalidate(self, quiz_id: str):
+        """Drop the cached quiz after it is edited or deleted"""
+        self._decoded.pop(quiz_id, None)
+        try:
+            await self.redis.delete(self._key(quiz_id))
+        except Exception as e:
+            logger.error(f"Error invalidating quiz cache for {quiz_id}: {e}")
+
+
+# Global instance
+quiz_cache = QuizCache()
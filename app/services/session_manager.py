@@ -1,34 +1,142 @@
-import json
+import orjson
 import logging
-import asyncio
 from datetime import datetime, timedelta
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 import random
 import string
 import redis.asyncio as redis
 
-from app.core.database import redis_client, collection as quiz_collection, results_collection
+from app.core.database import redis_client, results_collection
 from app.core.config import SESSION_EXPIRY_HOURS
-from bson import ObjectId
+from app.services.quiz_cache import quiz_cache
 
 logger = logging.getLogger(__name__)
 
+def participants_key(session_code: str) -> str:
+    """Redis hash of a session's participants: field = user_id, value = that participant's JSON"""
+    return f"session:{session_code}:participants"
+
+def scores_key(session_code: str) -> str:
+    """Redis sorted set of a session's scores: member = user_id, score = encoded total points
+    and answer count (see decode_score)"""
+    return f"session:{session_code}:scores"
+
+def answers_key(session_code: str, user_id: str) -> str:
+    """Redis list of one participant's answer JSONs, in the order they were given"""
+    return f"session:{session_code}:answers:{user_id}"
+
+# The scores set holds points * SCORE_SCALE - answers given, so it ranks by points and then
+# by fewer answers, and a ZSCORE / ZRANGE gives both values without reading any answers
+SCORE_SCALE = 10_000
+
+def score_increment(points: int) -> int:
+    """What one answer worth points adds to its participant's scores set value"""
+    return points * SCORE_SCALE - 1
+
+def decode_score(value: Any) -> Tuple[int, int]:
+    """(total points, answers given) from a scores set value"""
+    value = int(float(value))
+    points = -(-value // SCORE_SCALE)
+    return points, points * SCORE_SCALE - value
+
+def decode_participants(raw: Dict[str, str], scores: Optional[Dict[str, float]] = None) -> Dict[str, Dict[str, Any]]:
+    """Decode an HGETALL of the participants hash into user_id -> participant.
+    With the scores set's values, each participant also gets its "score"."""
+    participants = {user_id: orjson.loads(participant) for user_id, participant in raw.items()}
+    if scores is not None:
+        for user_id, participant in participants.items():
+            participant["score"] = decode_score(scores.get(user_id, 0))[0]
+    return participants
+
+# Lua scripts for the hot session flows. Each runs atomically on the Redis server,
+# so a join/start/end costs one round-trip instead of several separate commands.
+
+# KEYS[1] = session key, KEYS[2] = participants hash, KEYS[3] = scores sorted set;
+# ARGV = user_id, new participant JSON
+# The participants hash and scores set are given the session's remaining TTL so all expire together.
+JOIN_SESSION_LUA = """
+local session = redis.call('HMGET', KEYS[1], 'host_id', 'status', 'quiz_id')
+if not session[1] then
+    return {'not_found'}
+end
+if session[1] == ARGV[1] then
+    return {'host'}
+end
+if redis.call('HEXISTS', KEYS[2], ARGV[1]) == 1 then
+    return {'rejoin', session[3]}
+end
+if session[2] ~= 'waiting' then
+    return {'started'}
+end
+redis.call('HSET', KEYS[2], ARGV[1], ARGV[2])
+redis.call('ZADD', KEYS[3], 0, ARGV[1])
+local ttl = redis.call('PTTL', KEYS[1])
+if ttl > 0 then
+    redis.call('PEXPIRE', KEYS[2], ttl)
+    redis.call('PEXPIRE', KEYS[3], ttl)
+end
+return {'joined', session[3], redis.call('HGETALL', KEYS[2]), redis.call('ZRANGE', KEYS[3], 0, -1, 'WITHSCORES')}
+"""
+
+# KEYS[1] = session key; ARGV = host_id, quiz start time
+START_SESSION_LUA = """
+local host_id = redis.call('HGET', KEYS[1], 'host_id')
+if not host_id then
+    return 'not_found'
+end
+if host_id ~= ARGV[1] then
+    return 'not_host'
+end
+redis.call('HSET', KEYS[1], 'status', 'active', 'quiz_start_time', ARGV[2])
+return 'started'
+"""
+
+# KEYS[1] = session key; ARGV = host_id ("" to skip the host check)
+END_SESSION_LUA = """
+local host_id = redis.call('HGET', KEYS[1], 'host_id')
+if not host_id then
+    return 'not_found'
+end
+if ARGV[1] ~= '' and host_id ~= ARGV[1] then
+    return 'not_host'
+end
+redis.call('HSET', KEYS[1], 'status', 'completed')
+return 'ended'
+"""
+
+# KEYS[1] = session key; ARGV = session code, TTL in seconds
+# Creates the session hash only if the code is free, with its expiry set in the same step,
+# so a create interrupted after the claim can't leave a session key that never expires
+CLAIM_CODE_LUA = """
+if redis.call('HSETNX', KEYS[1], 'session_code', ARGV[1]) == 0 then
+    return 0
+end
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
 class SessionManager:
     def __init__(self):
         self.redis = redis_client
+        # Registered scripts are invoked with EVALSHA (and loaded on first use)
+        self._join_script = self.redis.register_script(JOIN_SESSION_LUA)
+        self._start_script = self.redis.register_script(START_SESSION_LUA)
+        self._end_script = self.redis.register_script(END_SESSION_LUA)
+        self._claim_script = self.redis.register_script(CLAIM_CODE_LUA)
 
     async def create_session(self, quiz_id: str, host_id: str, mode: str = "live", 
                             per_question_time_limit: int = 30) -> str:
         """Create a new session and return the session code"""
-        # Generate unique code
-        session_code = await self._generate_unique_code()
-        
-        # Fetch quiz details to cache basic info
-        quiz = await quiz_collection.find_one({"_id": ObjectId(quiz_id)})
+        # Load the quiz through the cache, warming it for the session's question/answer events
+        quiz = await quiz_cache.get(quiz_id)
         if not quiz:
             raise ValueError("Quiz not found")
+        
+        # Claim a unique code (the session hash is created, with its TTL, by the claim)
+        session_code = await self._generate_unique_code()
 
         # Initialize session state in Redis
+        now = datetime.utcnow()
         session_data = {
             "session_code": session_code,
             "quiz_id": quiz_id,
@@ -36,37 +144,42 @@ class SessionManager:
             "status": "waiting",  # waiting, active, completed
             "mode": mode,
             "current_question_index": 0,
-            "created_at": datetime.utcnow().isoformat(),
-            "expires_at": (datetime.utcnow() + timedelta(hours=SESSION_EXPIRY_HOURS)).isoformat(),
+            "created_at": now.isoformat(),
+            "expires_at": (now + timedelta(hours=SESSION_EXPIRY_HOURS)).isoformat(),
             "quiz_title": quiz.get("title", "Untitled Quiz"),
-            "total_questions": len(quiz.get("questions", [])),
-            "participants": "{}",  # JSON string of participant dict
+            "total_questions": len(quiz.get("questions") or []),
             "per_question_time_limit": per_question_time_limit
         }
         
-        # Store in Redis with expiration
+        # Store in Redis; the key already expires from the claim, and HSET keeps that TTL
         await self.redis.hset(f"session:{session_code}", mapping=session_data)
-        await self.redis.expire(f"session:{session_code}", SESSION_EXPIRY_HOURS * 3600)
         
         return session_code
 
     async def _generate_unique_code(self) -> str:
-        """Generate a unique 6-character alphanumeric code"""
+        """Generate a unique 6-character alphanumeric code and claim its session key.
+
+        CLAIM_CODE_LUA checks the code, creates the key and sets its expiry in one
+        atomic round-trip, so two concurrent creates can never be handed the same
+        code and a claimed code is always freed once the session expires.
+        """
         chars = string.ascii_uppercase + string.digits
         while True:
             code = ''.join(random.choices(chars, k=6))
-            if not await self.redis.exists(f"session:{code}"):
+            if await self._claim_script(keys=[f"session:{code}"], args=[code, SESSION_EXPIRY_HOURS * 3600]):
                 return code
 
     async def get_session(self, session_code: str) -> Optional[Dict[str, Any]]:
-        """Retrieve session state from Redis"""
-        session_data = await self.redis.hgetall(f"session:{session_code}")
+        """Retrieve session state, with its participants, from Redis"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hgetall(f"session:{session_code}")
+            pipe.hgetall(participants_key(session_code))
+            pipe.zrange(scores_key(session_code), 0, -1, withscores=True)
+            session_data, participants, scores = await pipe.execute()
         if not session_data:
             return None
             
-        # Parse nested JSON fields
-        if "participants" in session_data and isinstance(session_data["participants"], str):
-            session_data["participants"] = json.loads(session_data["participants"])
+        session_data["participants"] = decode_participants(participants, dict(scores))
             
         # Convert numeric fields
         if "current_question_index" in session_data:
@@ -76,126 +189,163 @@ class SessionManager:
             
         return session_data
 
-    async def add_participant(self, session_code: str, user_id: str, username: str) -> bool:
-        """Add a participant to the session (excluding host) - with distributed lock for race conditions"""
+    async def get_participants_view(self, session_code: str) -> Optional[Dict[str, Any]]:
+        """Fetch only what participant polling needs: participants, mode and status"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hmget(f"session:{session_code}", ["mode", "status"])
+            pipe.hgetall(participants_key(session_code))
+            pipe.zrange(scores_key(session_code), 0, -1, withscores=True)
+            (mode, status), participants, scores = await pipe.execute()
+        if status is None:
+            return None
+        return {"participants": decode_participants(participants, dict(scores)), "mode": mode, "status": status}
+
+    async def join(self, session_code: str, user_id: str, username: str) -> Dict[str, Any]:
+        """Add or reconnect a participant (excluding host) in as few round-trips as possible.
+
+        Returns a dict with "status" ("joined", "rejoined", "not_found", "host" or
+        "started") and, on success, the updated "participants" dict and "quiz_id".
+        """
         session_key = f"session:{session_code}"
-        lock_key = f"lock:session:{session_code}:participants"
+        new_participant = {
+            "user_id": user_id,
+            "username": username,
+            "joined_at": datetime.utcnow().isoformat(),
+            "connected": True
+        }
         
-        # Check if user is the host - hosts should NOT be in participant list
-        host_id = await self.redis.hget(session_key, "host_id")
-        if user_id == host_id:
-            logger.info(f"Rejected participant join: {user_id} is the host of session {session_code}")
-            return False
+        participants_hash = participants_key(session_code)
+        scores_set = scores_key(session_code)
+        status, *rest = await self._join_script(
+            keys=[session_key, participants_hash, scores_set],
+            args=[user_id, orjson.dumps(new_participant)]
+        )
         
-        # Acquire distributed lock with retry
-        max_retries = 20
-        lock_timeout = 5  # Lock expires after 5 seconds
+        if status == "joined":
+            quiz_id, flat_participants, flat_scores = rest
+            # HGETALL / ZRANGE WITHSCORES from a script come back as flat [field, value, ...] lists
+            participants = decode_participants(
+                dict(zip(flat_participants[::2], flat_participants[1::2])),
+                dict(zip(flat_scores[::2], flat_scores[1::2]))
+            )
+            logger.info(f"✅ Successfully added {username} to session {session_code} (total: {len(participants)} participants)")
+            return {"status": status, "participants": participants, "quiz_id": quiz_id}
         
-        for attempt in range(max_retries):
-            try:
-                # Try to acquire lock using SETNX (SET if Not eXists)
-                lock_acquired = await self.redis.set(
-                    lock_key, 
-                    user_id, 
-                    nx=True,  # Only set if not exists
-                    ex=lock_timeout  # Expire after 5 seconds
-                )
-                
-                if not lock_acquired:
-                    # Lock held by another process, wait and retry
-                    await asyncio.sleep(0.05 + (0.02 * attempt))  # 50ms + backoff
-                    continue
-                
+        if status == "rejoin":
+            # Reconnecting user - preserve state
+            participants = await self._reconnect_participant(participants_hash, scores_set, user_id, username)
+            logger.info(f"🔄 Reconnected participant {username} ({user_id}) to session {session_code}")
+            return {"status": "rejoined", "participants": participants, "quiz_id": rest[0]}
+        
+        if status == "host":
+            logger.info(f"Rejected participant join: {user_id} is the host of session {session_code}")
+        return {"status": status}
+
+    async def _reconnect_participant(self, participants_hash: str, scores_set: str,
+                                     user_id: str, username: str) -> Dict[str, Any]:
+        """Mark an existing participant as connected again (optimistic WATCH/MULTI update).
+        Returns every participant with their score, read back in the same transaction."""
+        async with self.redis.pipeline(transaction=True) as pipe:
+            while True:
                 try:
-                    # We have the lock - safely read and update participants
-                    participants_json = await self.redis.hget(session_key, "participants")
-                    if not participants_json:
-                        logger.error(f"Session {session_code} not found or has no participants field")
-                        return False
+                    await pipe.watch(participants_hash)
+                    participant = orjson.loads(await pipe.hget(participants_hash, user_id))
+                    participant["connected"] = True
+                    participant["username"] = username
                     
-                    participants = json.loads(participants_json)
-                    
-                    # Add or update participant
-                    if user_id in participants:
-                        # Reconnecting user - preserve state
-                        participants[user_id]["connected"] = True
-                        participants[user_id]["username"] = username
-                        logger.info(f"🔄 Reconnecting participant {username} ({user_id}) to session {session_code}")
-                    else:
-                        # New participant
-                        participants[user_id] = {
-                            "user_id": user_id,
-                            "username": username,
-                            "joined_at": datetime.utcnow().isoformat(),
-                            "connected": True,
-                            "score": 0,
-                            "answers": []
-                        }
-                        logger.info(f"🆕 Adding NEW participant {username} ({user_id}) to session {session_code}")
-                    
-                    # Save updated participants
-                    await self.redis.hset(session_key, "participants", json.dumps(participants))
-                    logger.info(f"✅ Successfully added {username} to session {session_code} (total: {len(participants)} participants)")
-                    return True
-                    
-                finally:
-                    # Always release the lock
-                    await self.redis.delete(lock_key)
-                    
-            except Exception as e:
-                logger.error(f"❌ Error adding participant {user_id} (attempt {attempt + 1}): {e}")
-                # Try to release lock in case of error
-                try:
-                    await self.redis.delete(lock_key)
-                except:
-                    pass
-                if attempt == max_retries - 1:
-                    return False
-                await asyncio.sleep(0.05 * (attempt + 1))
-                continue
+                    pipe.multi()
+                    pipe.hset(participants_hash, user_id, orjson.dumps(participant))
+                    pipe.hgetall(participants_hash)
+                    pipe.zrange(scores_set, 0, -1, withscores=True)
+                    _, participants, scores = await pipe.execute()
+                    return decode_participants(participants, dict(scores))
+                except redis.WatchError:
+                    # Participants changed between WATCH and EXEC - retry with fresh data
+                    continue
+
+    async def add_participant(self, session_code: str, user_id: str, username: str) -> Optional[Dict[str, Any]]:
+        """Add a participant to the session (excluding host).
+
+        Returns the updated participants dict, or None if the participant could not be added.
+        """
+        try:
+            result = await self.join(session_code, user_id, username)
+        except Exception as e:
+            logger.error(f"❌ Error adding participant {user_id}: {e}")
+            return None
         
-        logger.error(f"❌ Failed to add participant {user_id} after {max_retries} attempts (could not acquire lock)")
-        return False
+        if result["status"] not in ("joined", "rejoined"):
+            logger.warning(f"❌ Could not add {user_id} to session {session_code}: {result['status']}")
+            return None
+        return result["participants"]
 
     async def remove_participant(self, session_code: str, user_id: str):
         """Mark participant as disconnected"""
-        session_key = f"session:{session_code}"
-        participants_json = await self.redis.hget(session_key, "participants")
-        if participants_json:
-            participants = json.loads(participants_json)
-            if user_id in participants:
-                participants[user_id]["connected"] = False
-                await self.redis.hset(session_key, "participants", json.dumps(participants))
-
-    async def start_session(self, session_code: str, host_id: str) -> bool:
-        """Transition session to active state"""
+        participants_hash = participants_key(session_code)
+        participant_json = await self.redis.hget(participants_hash, user_id)
+        if participant_json:
+            participant = orjson.loads(participant_json)
+            participant["connected"] = False
+            await self.redis.hset(participants_hash, user_id, orjson.dumps(participant))
+
+    async def get_start_state(self, session_code: str) -> Tuple[List[str], int]:
+        """The participant IDs and per-question time limit a quiz start needs, in one round trip"""
+        async with self.redis.pipeline(transaction=False) as pipe:
+            pipe.hkeys(participants_key(session_code))
+            pipe.hget(f"session:{session_code}", "per_question_time_limit")
+            participant_ids, per_question_time_limit = await pipe.execute()
+        return participant_ids, int(per_question_time_limit or 30)
+
+    async def get_answers(self, session_code: str, user_ids: List[str]) -> Dict[str, List[Dict[str, Any]]]:
+        """Every answer each of user_ids has given, in one round trip"""
+        if not user_ids:
+            return {}
+        async with self.redis.pipeline(transaction=False) as pipe:
+            for user_id in user_ids:
+                pipe.lrange(answers_key(session_code, user_id), 0, -1)
+            answer_lists = await pipe.execute()
+        return {
+            user_id: [orjson.loads(answer) for answer in answers]
+            for user_id, answers in zip(user_ids, answer_lists)
+        }
+
+    async def start_session(self, session_code: str, host_id: str) -> str:
+        """Transition session to active state if host_id is the host.
+
+        Returns "started", "not_found" or "not_host".
+        """
         logger.info(f"🎮 Starting session {session_code} by host {host_id}")
         
-        session = await self.get_session(session_code)
-        if not session:
-            logger.error(f"❌ Session {session_code} not found!")
-            return False
-            
-        if session["host_id"] != host_id:
-            logger.error(f"❌ User {host_id} is not the host (actual host: {session['host_id']})")
-            return False
-        
-        logger.info(f"✅ Setting session {session_code} status to 'active'")
-        logger.info(f"📊 Session data: quiz_id={session.get('quiz_id')}, participants={len(session.get('participants', {}))}")
+        # Host check and status update run atomically in a single round-trip
+        result = await self._start_script(
+            keys=[f"session:{session_code}"],
+            args=[host_id, datetime.utcnow().isoformat()]
+        )
         
-        # Set status to active and record quiz start time
-        await self.redis.hset(f"session:{session_code}", mapping={
-            "status": "active",
-            "quiz_start_time": datetime.utcnow().isoformat()
-        })
-        return True
-
-    async def end_session(self, session_code: str) -> bool:
-        """Mark session as completed"""
-        await self.redis.hset(f"session:{session_code}", "status", "completed")
-        return True
+        if result == "not_found":
+            logger.error(f"❌ Session {session_code} not found!")
+        elif result == "not_host":
+            logger.error(f"❌ User {host_id} is not the host of session {session_code}")
+        else:
+            logger.info(f"✅ Set session {session_code} status to 'active'")
+        return result
+
+    async def end_session(self, session_code: str, host_id: Optional[str] = None) -> str:
+        """Mark session as completed, optionally only if host_id is the host.
+
+        Returns "ended", "not_found" or "not_host".
+        """
+        return await self._end_script(keys=[f"session:{session_code}"], args=[host_id or ""])
+
+    async def get_host_id(self, session_code: str) -> Optional[str]:
+        """Get the host's user ID, or None if the session doesn't exist"""
+        return await self.redis.hget(f"session:{session_code}", "host_id")
 
     async def is_host(self, session_code: str, user_id: str) -> bool:
         """Check if user is the host"""
-        host_id = await self.redis.hget(f"session:{session_code}", "host_id")
+        host_id = await self.get_host_id(session_code)
         return host_id == user_id
+
+
+# Global instance
+session_manager = SessionManager()
@@ -1,166 +1,290 @@
-from typing import Dict, Set
+from collections import deque
+from typing import Any, Dict, FrozenSet, List, NamedTuple, Optional, Set, Union
 from fastapi import WebSocket
-import json
+import asyncio
 import logging
+import time
+
+from app.services.connection_manager import JSON_FORMAT, EncodedMessage, encode_message
 
 logger = logging.getLogger(__name__)
 
+# Encoded payloads kept for keyed broadcasts; oldest entries are dropped past this many
+ENCODED_CACHE_SIZE = 256
+# Send priorities: critical messages (question start/end, results) are always delivered;
+# drop_ok ones (timer ticks, leaderboard updates) may be discarded for a client that falls behind
+PRIORITY_CRITICAL = "critical"
+PRIORITY_DROP_OK = "drop_ok"
+# Past this many waiting messages a connection is backed up: its oldest drop_ok messages are discarded
+OUTBOX_HIGH_WATERMARK = 64
+# A connection is disconnected with this many waiting messages, or once backed up for this long
+OUTBOX_SIZE = 256
+SLOW_CLIENT_TIMEOUT_SECONDS = 10.0
+
+# Send methods take a message dict, or an EncodedMessage built once by a caller that
+# sends the same message to several sessions or users
+Message = Union[dict, EncodedMessage]
+
+# Stand-in for a session with no connections in read-only lookups; never mutated
+_EMPTY: Dict[str, "Connection"] = {}
+
+class _Outbox:
+    """Messages waiting to be written to one connection, oldest first"""
+    __slots__ = ("items", "ready", "backed_up_since")
+
+    def __init__(self):
+        self.items: deque = deque()  # (payload, droppable)
+        self.ready = asyncio.Event()
+        self.backed_up_since: Optional[float] = None
+
+class ConnKey(NamedTuple):
+    """Composite key of one connection in the flat connection store"""
+    session: str
+    user: str
+
+class Connection:
+    """One user's connection to a session: its socket, role and outbound queue, in one object"""
+    __slots__ = ("websocket", "session", "user", "is_host", "outbox", "writer")
+
+    def __init__(self, websocket: WebSocket, session: str, user: str, is_host: bool):
+        self.websocket = websocket
+        self.session = session
+        self.user = user
+        self.is_host = is_host
+        self.outbox = _Outbox()
+        self.writer: Optional[asyncio.Task] = None
+
 class ConnectionManager:
     """Manages WebSocket connections for live multiplayer sessions"""
     
     def __init__(self):
-        # session_code -> {user_id -> WebSocket}
-        self.active_connections: Dict[str, Dict[str, WebSocket]] = {}
-        # user_id -> session_code (for reverse lookup)
-        self.user_sessions: Dict[str, str] = {}
-        # session_code -> {user_id -> isHost}
-        self.connection_roles: Dict[str, Dict[str, bool]] = {}
+        # (session_code, user_id) -> Connection; a single-connection lookup is one hashed access
+        self.connections: Dict[ConnKey, Connection] = {}
+        # session_code -> {user_id -> Connection}, for fan-out
+        self.sessions: Dict[str, Dict[str, Connection]] = {}
+        # session_code -> {user_id -> Connection}, split by role so role-filtered
+        # broadcasts iterate only the bucket they need
+        self.hosts: Dict[str, Dict[str, Connection]] = {}
+        self.participants: Dict[str, Dict[str, Connection]] = {}
+        # session_code -> frozen participant IDs, rebuilt after a connect/disconnect in that session
+        self._participant_ids: Dict[str, FrozenSet[str]] = {}
+        # cache_key -> encoded payload, for messages broadcast more than once unchanged
+        self._encoded_cache: Dict[str, str] = {}
+        # Backpressure counters, for monitoring
+        self.messages_dropped = 0
+        self.slow_clients = 0
     
     async def connect(self, websocket: WebSocket, session_code: str, user_id: str, is_host: bool = False):
         """Register a new WebSocket connection"""
         await websocket.accept()
         
-        if session_code not in self.active_connections:
-            self.active_connections[session_code] = {}
+        key = ConnKey(session_code, user_id)
+        previous = self.connections.get(key)
+        if previous is not None:
+            self._unhook(previous)
         
-        if session_code not in self.connection_roles:
-            self.connection_roles[session_code] = {}
+        # Each connection's writer drains its outbox, so sends never await a client
+        # and the connection receives its messages in order
+        conn = Connection(websocket, session_code, user_id, is_host)
+        conn.writer = asyncio.create_task(self._writer(conn))
         
-        self.active_connections[session_code][user_id] = websocket
-        self.user_sessions[user_id] = session_code
-        self.connection_roles[session_code][user_id] = is_host
+        self.connections[key] = conn
+        self.sessions.setdefault(session_code, {})[user_id] = conn
+        self._role_bucket(conn).setdefault(session_code, {})[user_id] = conn
+        self._participant_ids.pop(session_code, None)
         
-        logger.info(f"User {user_id} connected to session {session_code} (host={is_host})")
+        logger.debug("User %s connected to session %s (host=%s)", user_id, session_code, is_host)
     
     async def disconnect(self, session_code: str, user_id: str):
         """Remove a WebSocket connection"""
-        if session_code in self.active_connections:
-            if user_id in self.active_connections[session_code]:
-                del self.active_connections[session_code][user_id]
-                logger.info(f"User {user_id} disconnected from session {session_code}")
-            
-            # Clean up empty sessions
-            if not self.active_connections[session_code]:
-                del self.active_connections[session_code]
+        conn = self.connections.get(ConnKey(session_code, user_id))
+        if conn is not None:
+            self._unhook(conn)
+            logger.debug("User %s disconnected from session %s", user_id, session_code)
+    
+    def _role_bucket(self, conn: Connection) -> Dict[str, Dict[str, Connection]]:
+        return self.hosts if conn.is_host else self.participants
+    
+    def _unhook(self, conn: Connection):
+        """Stop a connection's writer and drop it from every map, using its cached session/user"""
+        # A writer stopping itself (after a failed send) just returns
+        if conn.writer is not None and conn.writer is not asyncio.current_task():
+            conn.writer.cancel()
         
-        if session_code in self.connection_roles:
-            if user_id in self.connection_roles[session_code]:
-                del self.connection_roles[session_code][user_id]
-            
-            # Clean up empty role tracking
-            if not self.connection_roles[session_code]:
-                del self.connection_roles[session_code]
+        session_code, user_id = conn.session, conn.user
+        self.connections.pop(ConnKey(session_code, user_id), None)
+        self._remove_from(self.sessions, session_code, user_id)
+        self._remove_from(self._role_bucket(conn), session_code, user_id)
+        self._participant_ids.pop(session_code, None)
+    
+    @staticmethod
+    def _remove_from(bucket: Dict[str, Dict[str, Connection]], session_code: str, user_id: str) -> bool:
+        """Drop a user from a per-session map, cleaning up the session's entry once it is empty.
+        Returns whether the user was there."""
+        connections = bucket.get(session_code)
+        if connections is None or connections.pop(user_id, None) is None:
+            return False
+        if not connections:
+            bucket.pop(session_code, None)
+        return True
+    
+    async def _writer(self, conn: Connection):
+        """Send one connection's queued messages, one frame each, until a send fails"""
+        outbox = conn.outbox
+        while True:
+            if not outbox.items:
+                outbox.ready.clear()
+                await outbox.ready.wait()
+                continue
+            payload, _ = outbox.items.popleft()
+            if len(outbox.items) <= OUTBOX_HIGH_WATERMARK:
+                outbox.backed_up_since = None
+            try:
+                await conn.websocket.send_text(payload)
+            except Exception as e:
+                logger.error("Error sending message to %s: %s", conn.user, e)
+                break
+        if self.connections.get(ConnKey(conn.session, conn.user)) is conn:
+            await self.disconnect(conn.session, conn.user)
+    
+    def _enqueue(self, conn: Connection, payload: str, droppable: bool) -> bool:
+        """Queue a payload for one connection; False if it is too far behind"""
+        outbox = conn.outbox
+        items = outbox.items
+        items.append((payload, droppable))
+        outbox.ready.set()
+        if len(items) <= OUTBOX_HIGH_WATERMARK:
+            return True
+        
+        # Backed up: shed the oldest drop_ok messages first
+        excess = len(items) - OUTBOX_HIGH_WATERMARK
+        kept = deque()
+        for item in items:
+            if excess and item[1]:
+                excess -= 1
+                self.messages_dropped += 1
+            else:
+                kept.append(item)
+        outbox.items = kept
         
-        if user_id in self.user_sessions:
-            del self.user_sessions[user_id]
+        if len(kept) <= OUTBOX_HIGH_WATERMARK:
+            return True
+        now = time.monotonic()
+        if outbox.backed_up_since is None:
+            outbox.backed_up_since = now
+        if len(kept) >= OUTBOX_SIZE or now - outbox.backed_up_since > SLOW_CLIENT_TIMEOUT_SECONDS:
+            logger.warning("Dropping slow client %s: %d messages waiting to be sent", conn.user, len(kept))
+            self.slow_clients += 1
+            return False
+        return True
+    
+    async def _enqueue_all(self, payload: str, targets: List[Connection], priority: str = PRIORITY_CRITICAL):
+        """Queue the same payload for every connection, disconnecting any that can't take it"""
+        droppable = priority == PRIORITY_DROP_OK
+        disconnected = [conn for conn in targets if not self._enqueue(conn, payload, droppable)]
+        if disconnected:
+            self._disconnect_many(disconnected)
+    
+    def _disconnect_many(self, conns: List[Connection]):
+        """Drop a batch of connections in one synchronous pass (disconnect has nothing to await)"""
+        for conn in conns:
+            self._unhook(conn)
+            logger.debug("User %s disconnected from session %s", conn.user, conn.session)
+    
+    def get_stats(self) -> Dict[str, Any]:
+        """Backpressure counters and current queue depth, for monitoring"""
+        return {
+            "connections": len(self.connections),
+            "queued_messages": sum(len(conn.outbox.items) for conn in self.connections.values()),
+            "messages_dropped": self.messages_dropped,
+            "slow_clients": self.slow_clients,
+        }
     
-    async def send_personal_message(self, message: dict, session_code: str, user_id: str):
+    async def send_personal_message(self, message: Message, session_code: str, user_id: str,
+                                    priority: str = PRIORITY_CRITICAL):
         """Send message to a specific user"""
-        if session_code in self.active_connections:
-            if user_id in self.active_connections[session_code]:
-                websocket = self.active_connections[session_code][user_id]
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to {user_id}: {e}")
-                    await self.disconnect(session_code, user_id)
-    
-    async def broadcast_to_session(self, message: dict, session_code: str):
-        """Broadcast message to all participants in a session"""
-        if session_code not in self.active_connections:
-            return
+        conn = self.connections.get(ConnKey(session_code, user_id))
+        if conn is not None:
+            await self._enqueue_all(self._encode(message), [conn], priority)
+    
+    def _encode(self, message: Message, cache_key: Optional[str] = None) -> str:
+        """Encode a message, reusing the payload cached under cache_key when there is one.
+        A cache_key must identify the message's content exactly (e.g. f"q:{session_code}:{qid}")."""
+        if isinstance(message, EncodedMessage):
+            # Encoded on its first send, then reused
+            return message.frame(JSON_FORMAT)
+        if cache_key is None:
+            return encode_message(message)
         
-        disconnected_users = []
-        for user_id, websocket in self.active_connections[session_code].items():
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to {user_id}: {e}")
-                disconnected_users.append(user_id)
+        payload = self._encoded_cache.get(cache_key)
+        if payload is None:
+            payload = encode_message(message)
+            if len(self._encoded_cache) >= ENCODED_CACHE_SIZE:
+                del self._encoded_cache[next(iter(self._encoded_cache))]
+            self._encoded_cache[cache_key] = payload
+        return payload
+    
+    async def broadcast_to_session(self, message: Message, session_code: str, cache_key: Optional[str] = None,
+                                   priority: str = PRIORITY_CRITICAL):
+        """Broadcast message to all participants in a session.
+        Messages sent repeatedly unchanged can pass a cache_key to skip re-encoding them;
+        ticks and leaderboard updates should pass priority=PRIORITY_DROP_OK."""
+        conns = self.sessions.get(session_code)
+        if not conns:
+            return
         
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(session_code, user_id)
+        # Serialize once; every recipient gets the same text frame
+        payload = self._encode(message, cache_key)
+        await self._enqueue_all(payload, list(conns.values()), priority)
     
-    async def broadcast_except(self, message: dict, session_code: str, exclude_user_id: str):
+    async def broadcast_except(self, message: Message, session_code: str, exclude_user_id: str,
+                               priority: str = PRIORITY_CRITICAL):
         """Broadcast to all participants except one"""
-        if session_code not in self.active_connections:
+        conns = self.sessions.get(session_code)
+        if not conns:
             return
         
-        disconnected_users = []
-        for user_id, websocket in self.active_connections[session_code].items():
-            if user_id == exclude_user_id:
-                continue
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to {user_id}: {e}")
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(session_code, user_id)
+        targets = [conn for user_id, conn in conns.items() if user_id != exclude_user_id]
+        if not targets:
+            return
+        payload = self._encode(message)
+        await self._enqueue_all(payload, targets, priority)
     
     def get_session_participants(self, session_code: str) -> Set[str]:
         """Get all connected user IDs for a session"""
-        if session_code in self.active_connections:
-            return set(self.active_connections[session_code].keys())
-        return set()
+        return set(self.sessions.get(session_code, _EMPTY))
     
     def is_user_connected(self, session_code: str, user_id: str) -> bool:
         """Check if a user is connected to a session"""
-        return (session_code in self.active_connections and 
-                user_id in self.active_connections[session_code])
+        # One hash of each id, without building a ConnKey
+        return user_id in self.sessions.get(session_code, _EMPTY)
     
-    async def broadcast_to_host(self, message: dict, session_code: str, host_id: str):
+    async def broadcast_to_host(self, message: Message, session_code: str, host_id: str,
+                                priority: str = PRIORITY_CRITICAL):
         """Send message specifically to the host"""
-        if session_code in self.active_connections:
-            if host_id in self.active_connections[session_code]:
-                websocket = self.active_connections[session_code][host_id]
-                try:
-                    await websocket.send_json(message)
-                except Exception as e:
-                    logger.error(f"Error sending message to host {host_id}: {e}")
-                    await self.disconnect(session_code, host_id)
-    
-    async def broadcast_to_participants(self, message: dict, session_code: str):
+        conn = self.connections.get(ConnKey(session_code, host_id))
+        if conn is not None:
+            await self._enqueue_all(self._encode(message), [conn], priority)
+    
+    async def broadcast_to_participants(self, message: Message, session_code: str,
+                                        priority: str = PRIORITY_CRITICAL):
         """Broadcast message to all participants (non-host users) in a session"""
-        if session_code not in self.active_connections:
-            return
-        
-        if session_code not in self.connection_roles:
+        conns = self.participants.get(session_code)
+        if not conns:
             return
         
-        disconnected_users = []
-        for user_id, websocket in self.active_connections[session_code].items():
-            # Skip if user is host
-            if self.connection_roles[session_code].get(user_id, False):
-                continue
-            
-            try:
-                await websocket.send_json(message)
-            except Exception as e:
-                logger.error(f"Error broadcasting to participant {user_id}: {e}")
-                disconnected_users.append(user_id)
-        
-        # Clean up disconnected users
-        for user_id in disconnected_users:
-            await self.disconnect(session_code, user_id)
+        payload = self._encode(message)
+        await self._enqueue_all(payload, list(conns.values()), priority)
     
-    def get_participant_ids(self, session_code: str) -> Set[str]:
+    def get_participant_ids(self, session_code: str) -> FrozenSet[str]:
         """Get all connected participant (non-host) user IDs for a session"""
-        if session_code not in self.active_connections:
-            return set()
-        
-        if session_code not in self.connection_roles:
-            return set()
-        
-        participants = set()
-        for user_id in self.active_connections[session_code].keys():
-            if not self.connection_roles[session_code].get(user_id, False):
-                participants.add(user_id)
-        
-        return participants
+        participant_ids = self._participant_ids.get(session_code)
+        if participant_ids is None:
+            participant_ids = frozenset(self.participants.get(session_code, _EMPTY))
+            # Only sessions with connections are cached, so ended sessions don't linger
+            if session_code in self.sessions:
+                self._participant_ids[session_code] = participant_ids
+        return participant_ids
 
 # Global instance
 manager = ConnectionManager()
@@ -1,7 +1,33 @@
 import secrets
 import string
+from datetime import datetime
+from typing import Any, Optional
 
 def generate_session_code(length: int = 6) -> str:
     """Generate a unique alphanumeric session code"""
     characters = string.ascii_uppercase + string.digits
     return ''.join(secrets.choice(characters) for _ in range(length))
+
+# Cached "Month, Year" string and the (year, month) it was formatted for
+_month_str = ""
+_month_key = None
+
+def current_month_str(now: Optional[datetime] = None) -> str:
+    """Current UTC month (or that of `now`) as "Month, Year", only re-formatted when the month changes"""
+    global _month_str, _month_key
+    now = now or datetime.utcnow()
+    key = (now.year, now.month)
+    if key != _month_key:
+        _month_str = now.strftime("%B, %Y")
+        _month_key = key
+    return _month_str
+
+def format_created_at(value: Any) -> str:
+    """Format a stored createdAt value as "Month, Year" for API responses.
+
+    New documents store createdAt as a BSON Date; older ones already hold the
+    formatted string, which is returned unchanged.
+    """
+    if isinstance(value, datetime):
+        return value.strftime("%B, %Y")
+    return value or ""
@@ -0,0 +1,46 @@
+"""
+Quiz Filter Backfill
+====================
+Fills in the lowercased category_lc / language_lc / title_lc / description_lc
+fields that the /quizzes/category, /quizzes/language and /quizzes/search
+endpoints query, for quizzes created before those fields were written on
+insert. Safe to run more than once.
+
+Usage:
+    python backfill_quiz_filters.py
+"""
+
+import asyncio
+import os
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "quiz_app")
+
+LOWERCASE_FIELDS = ("category", "language", "title", "description")
+
+
+async def run():
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[MONGODB_DB_NAME]
+
+    print(f"Backfilling quiz filter fields in {MONGODB_DB_NAME}...")
+    # Single server-side update; documents that already have every field are skipped
+    result = await db.quizzes.update_many(
+        {"$or": [{f"{field}_lc": {"$exists": False}} for field in LOWERCASE_FIELDS]},
+        [{"$set": {
+            f"{field}_lc": {"$toLower": {"$ifNull": [f"${field}", ""]}}
+            for field in LOWERCASE_FIELDS
+        }}]
+    )
+    print(f"  quizzes: updated {result.modified_count}")
+
+    client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(run())
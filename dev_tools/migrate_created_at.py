@@ -0,0 +1,71 @@
+"""
+createdAt Migration
+===================
+Converts legacy "Month, Year" createdAt strings (e.g. "November, 2024") into
+BSON Dates so they sort chronologically and can use the createdAt indexes.
+Each value becomes the first day of its month. Safe to run more than once.
+
+Usage:
+    python migrate_created_at.py [collection ...]
+
+Example:
+    python migrate_created_at.py flashcard_sets
+"""
+
+import asyncio
+import argparse
+import os
+from datetime import datetime
+
+from dotenv import load_dotenv
+from motor.motor_asyncio import AsyncIOMotorClient
+
+load_dotenv()
+
+MONGODB_URL = os.getenv("MONGODB_URL", "mongodb://localhost:27017")
+MONGODB_DB_NAME = os.getenv("MONGODB_DB_NAME", "quiz_app")
+
+DEFAULT_COLLECTIONS = ["flashcard_sets", "quizzes"]
+
+
+async def migrate_collection(db, name: str):
+    collection = db[name]
+    migrated = 0
+    skipped = 0
+
+    cursor = collection.find({"createdAt": {"$type": "string"}}, {"createdAt": 1})
+    async for doc in cursor:
+        try:
+            created_at = datetime.strptime(doc["createdAt"], "%B, %Y")
+        except ValueError:
+            skipped += 1
+            continue
+
+        await collection.update_one({"_id": doc["_id"]}, {"$set": {"createdAt": created_at}})
+        migrated += 1
+
+    print(f"  {name}: migrated {migrated}, skipped {skipped} unparseable values")
+
+
+async def run(collections):
+    client = AsyncIOMotorClient(MONGODB_URL)
+    db = client[MONGODB_DB_NAME]
+
+    print(f"Migrating createdAt in {MONGODB_DB_NAME}...")
+    for name in collections:
+        await migrate_collection(db, name)
+
+    client.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Convert legacy createdAt strings to BSON Dates")
+    parser.add_argument("collections", nargs="*", default=DEFAULT_COLLECTIONS,
+                        help=f"Collections to migrate (default: {' '.join(DEFAULT_COLLECTIONS)})")
+
+    args = parser.parse_args()
+    asyncio.run(run(args.collections))
+
+
+if __name__ == "__main__":
+    main()